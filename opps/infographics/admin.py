@@ -1,14 +1,21 @@
 # -*- coding: utf-8 -*-
 from django.contrib import admin
 from django import forms
+from django.db.models.query import prefetch_related_objects
 from django.utils.translation import ugettext_lazy as _
 from .models import (Infographic, InfographicContainer,
-                     InfographicItem, InfographicInfographicItem)
+                     InfographicItem, InfographicInfographicItem,
+                     InfographicBox, InfographicBoxInfographics)
 
 from opps.core.admin import PublishableAdmin
 from opps.core.widgets import OppsEditor
 from opps.core.admin import apply_opps_rules
-from opps.images.generate import image_url
+
+from .menu import menu_items
+from .renditions import build_renditions, rendition_urls
+from .snapshot import SNAPSHOT_PREFETCH
+from .thumbnails import thumb_tag
+from .warmup import warm_renditions
 
 
 class InfographicAdminForm(forms.ModelForm):
@@ -24,6 +31,46 @@ class InfographicItemForm(forms.ModelForm):
         widgets = {"description": OppsEditor()}
 
 
+class InfographicFilter(admin.SimpleListFilter):
+    """
+    Filter items by infographic id or title typed in a search box, instead
+    of listing every infographic in the sidebar
+    """
+    title = _(u'Infographic')
+    parameter_name = 'infographic'
+    template = 'admin/infographics/input_filter.html'
+
+    def lookups(self, request, model_admin):
+        if self.value():
+            return [(self.value(), self.value())]
+        return []
+
+    def has_output(self):
+        return True
+
+    def queryset(self, request, queryset):
+        value = self.value()
+        if not value:
+            return queryset
+        if value.isdigit():
+            return queryset.filter(
+                infographicitem_item__infographic__id=value).distinct()
+        return queryset.filter(
+            infographicitem_item__infographic__title__icontains=value
+        ).distinct()
+
+    def choices(self, cl):
+        yield {
+            'selected': self.value() is None,
+            'query_string': cl.get_query_string({}, [self.parameter_name]),
+            'display': _(u'All'),
+            'parameter_name': self.parameter_name,
+            'value': self.value() or u'',
+            'hidden_params': [(k, v) for k, v in cl.params.items()
+                              if k != self.parameter_name],
+        }
+
+
 class InfographicContainerInline(admin.TabularInline):
     model = InfographicContainer
     fk_name = 'infographic'
@@ -43,11 +90,14 @@ class InfographicItemInline(admin.TabularInline):
 
     readonly_fields = ['image_thumb']
 
+    def queryset(self, request):
+        return super(InfographicItemInline, self).queryset(
+            request).select_related('item__image')
+
     def image_thumb(self, obj):
-        if obj.item.image:
-            return u'<img width="60px" height="60px" src="{0}" />'.format(
-                image_url(obj.item.image.image.url, width=60, height=60))
-        return _(u'No Image')
+        if not obj.item_id:
+            return _(u'No Image')
+        return thumb_tag(obj.item.image)
     image_thumb.short_description = _(u'Thumbnail')
     image_thumb.allow_tags = True
 
@@ -83,11 +133,37 @@ class InfographicAdmin(PublishableAdmin):
 
     readonly_fields = ['image_thumb', 'top_thumb']
 
+    def queryset(self, request):
+        return super(InfographicAdmin, self).queryset(
+            request).select_related('top_image', 'main_image')
+
+    def save_model(self, request, obj, form, change):
+        # an infographic going live stays offline until the renditions of
+        # its items, saved by the inlines, are warm, see save_related
+        obj.hold_live = obj.should_be_live() and not (
+            change and Infographic.objects.filter(
+                pk=obj.pk, is_live=True).exists())
+        super(InfographicAdmin, self).save_model(request, obj, form, change)
+
+    def save_related(self, request, form, formsets, change):
+        super(InfographicAdmin, self).save_related(request, form, formsets,
+                                                   change)
+        if form.instance.hold_live:
+            infographic = Infographic.objects.get(pk=form.instance.pk)
+            prefetch_related_objects([infographic], SNAPSHOT_PREFETCH)
+            warm_renditions(rendition_urls(build_renditions(
+                infographic, menu_items(infographic))))
+            infographic.save()
+            form.instance.hold_live = False
+            form.instance.is_live = infographic.is_live
+
+    def image_thumb(self, obj):
+        return thumb_tag(obj.main_image, renditions=obj.renditions)
+    image_thumb.short_description = _(u'Thumbnail')
+    image_thumb.allow_tags = True
+
     def top_thumb(self, obj):
-        if obj.top_image:
-            return u'<img width="60px" height="60px" src="{0}" />'.format(
-                image_url(obj.top_image.image.url, width=60, height=60))
-        return _(u'No Image')
+        return thumb_tag(obj.top_image, renditions=obj.renditions)
     top_thumb.short_description = _(u'Thumbnail')
     top_thumb.allow_tags = True
 
@@ -97,7 +173,7 @@ class InfographicItemAdmin(admin.ModelAdmin):
     prepopulated_fields = {"slug": ("title",)}
     raw_id_fields = ('image', 'album', 'timeline')
     list_display = ('title', 'group', 'order', 'belongs')
-    list_filter = ('group', 'infographic_item')
+    list_filter = ('group', InfographicFilter)
     list_editable = ('order',)
     ordering = ('order',)
     form = InfographicItemForm
@@ -112,14 +188,51 @@ class InfographicItemAdmin(admin.ModelAdmin):
 
     readonly_fields = ['image_thumb']
 
+    def queryset(self, request):
+        # memberships for the belongs column, two queries for the whole page
+        return super(InfographicItemAdmin, self).queryset(
+            request).select_related('image').prefetch_related(
+                'infographicitem_item__infographic')
+
     def image_thumb(self, obj):
-        if obj.image:
-            return u'<img width="60px" height="60px" src="{0}" />'.format(
-                image_url(obj.image.image.url, width=60, height=60))
-        return _(u'No Image')
+        return thumb_tag(obj.image)
     image_thumb.short_description = _(u'Thumbnail')
     image_thumb.allow_tags = True
 
 
+class InfographicBoxInfographicsInline(admin.TabularInline):
+    model = InfographicBoxInfographics
+    fk_name = 'infographicbox'
+    raw_id_fields = ['infographic']
+    actions = None
+    ordering = ('order',)
+    extra = 1
+    fieldsets = [(None, {
+        'classes': ('collapse',),
+        'fields': ('infographic', 'order')})]
+
+
+@apply_opps_rules('infographics')
+class InfographicBoxAdmin(PublishableAdmin):
+    prepopulated_fields = {"slug": ["name"]}
+    list_display = ['name', 'channel', 'date_available', 'published']
+    list_filter = ['date_available', 'published']
+    search_fields = ['name']
+    exclude = ('user',)
+    raw_id_fields = ['channel']
+    inlines = [InfographicBoxInfographicsInline]
+
+    fieldsets = (
+        (_(u'Identification'), {
+            'fields': ('site', 'name', 'slug')}),
+        (_(u'Relationships'), {
+            'fields': ('channel',)}),
+        (_(u'Publication'), {
+            'classes': ('extrapretty'),
+            'fields': ('published', 'date_available')}),
+    )
+
+
 admin.site.register(Infographic, InfographicAdmin)
 admin.site.register(InfographicItem, InfographicItemAdmin)
+admin.site.register(InfographicBox, InfographicBoxAdmin)
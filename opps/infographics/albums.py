@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+from django.conf import settings
+from django.utils import timezone
+
+from opps.images.models import Image
+
+
+# images rendered with the gallery page, the rest are fetched on demand
+ALBUM_PAGE_SIZE = getattr(settings, 'OPPS_INFOGRAPHICS_ALBUM_PAGE_SIZE', 12)
+ALBUM_IMAGE_WIDTH = 600
+
+
+def album_images(album_id):
+    return Image.objects.filter(
+        containerimage__container=album_id,
+        published=True,
+        date_available__lte=timezone.now()
+    ).order_by('containerimage__order', 'pk')
+
+
+def album_page(album_id, offset=0, size=ALBUM_PAGE_SIZE):
+    """
+    Return (images, has_more, next_offset) for one page of the album, a
+    single query whatever the album size. Images without a file are not
+    shown but count in next_offset.
+    """
+    images = list(album_images(album_id)[offset:offset + size + 1])
+    page = images[:size]
+    return page, len(images) > size, offset + len(page)
+
+
+def first_album_page(album):
+    """
+    album_page(album.pk), kept on album while it is being serialized
+    """
+    if not hasattr(album, '_infographics_first_page'):
+        album._infographics_first_page = album_page(album.pk)
+    return album._infographics_first_page
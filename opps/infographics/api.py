@@ -0,0 +1,287 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import json
+from hashlib import md5
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.urlresolvers import reverse
+from django.db.models import Count, Max
+from django.http import (HttpResponse, HttpResponseRedirect,
+                         StreamingHttpResponse, Http404)
+from django.utils.dateparse import parse_datetime
+from django.views.decorators.http import condition, require_GET
+
+from opps.images.generate import image_url
+from opps.timelinejs.models import Timeline
+
+from .albums import album_page, ALBUM_IMAGE_WIDTH
+from .menu import MENU_PREFETCH, menu_items
+from .models import Infographic, InfographicItem, app_namespace
+from .pagination import paginate
+from .resolvers import get_resolver
+from .snapshot import get_snapshot
+from .timeline import get_timeline
+
+
+# infographics serialized per query on the streamed list
+CHUNK_SIZE = 100
+
+
+def _image_url(image):
+    if image and image.image:
+        return image.image.url
+
+
+def serialize_item(infographic, item):
+    album = None
+    if item.album:
+        album = {'id': item.album.pk,
+                 'slug': item.album.slug,
+                 'title': item.album.title,
+                 'images': reverse(
+                     '{0}:api_item_album'.format(app_namespace),
+                     kwargs={'slug': infographic.slug,
+                             'item_slug': item.slug})}
+    return {
+        'id': item.pk,
+        'title': item.title,
+        'slug': item.slug,
+        'description': item.description,
+        'group': item.group,
+        'order': item.order,
+        'css_text': item.css_text,
+        'image': _image_url(item.image),
+        'album': album,
+        'timeline': item.timeline_id,
+        'url': reverse('{0}:item_infographic'.format(app_namespace),
+                       kwargs={'slug': infographic.slug,
+                               'item_slug': item.slug}),
+    }
+
+
+def serialize_infographic(infographic, items=None):
+    if items is None:
+        items = menu_items(infographic)
+    return {
+        'id': infographic.pk,
+        'title': infographic.title,
+        'slug': infographic.slug,
+        'headline': infographic.headline,
+        'description': infographic.description,
+        'type': infographic.type,
+        'channel': (infographic.channel.long_slug
+                    if infographic.channel else None),
+        'top_image': _image_url(infographic.top_image),
+        'main_image': _image_url(infographic.main_image),
+        'timeline': infographic.timeline_id,
+        'css_path': infographic.css_path,
+        'js_path': infographic.js_path,
+        'date_available': infographic.date_available,
+        'date_update': infographic.date_update,
+        'url': infographic.get_absolute_url(),
+        'items': [serialize_item(infographic, item) for item in items],
+    }
+
+
+def published_infographics(request):
+    queryset = Infographic.objects.all_published().filter(
+        site=get_resolver(request).site)
+    if request.GET.get('channel'):
+        channel = get_resolver(request).channel(request.GET['channel'])
+        if channel is None:
+            return queryset.none()
+        queryset = queryset.filter(channel=channel)
+    return queryset
+
+
+def with_items(queryset):
+    return queryset.select_related(
+        'channel', 'top_image', 'main_image'
+    ).prefetch_related(MENU_PREFETCH,
+                       MENU_PREFETCH + '__image',
+                       MENU_PREFETCH + '__album')
+
+
+def _list_state(request):
+    if not hasattr(request, '_infographics_list_state'):
+        request._infographics_list_state = published_infographics(
+            request).aggregate(count=Count('id'),
+                               date_update=Max('date_update'),
+                               date_available=Max('date_available'))
+    return request._infographics_list_state
+
+
+def list_last_modified(request):
+    state = _list_state(request)
+    dates = [d for d in (state['date_update'], state['date_available']) if d]
+    return max(dates) if dates else None
+
+
+def list_etag(request):
+    state = _list_state(request)
+    return md5(u'{0}:{1}:{2}:{3}'.format(
+        request.GET.get('channel'), state['count'], state['date_update'],
+        state['date_available']).encode('utf-8')).hexdigest()
+
+
+def _infographic_state(request, slug):
+    """
+    JSON document of the live infographic slug, read from its snapshot
+    """
+    if not hasattr(request, '_infographics_detail_state'):
+        site = get_resolver(request).site
+        document = get_snapshot(site, slug)
+        channel_update = None
+        if document is not None:
+            if document['infographic']['channel']:
+                channel_update = document['infographic']['channel'][
+                    'date_update']
+            document = document['api']
+        else:
+            # snapshot not built yet, see build_infographic_snapshots
+            infographics = list(with_items(
+                Infographic.objects.all_published().filter(
+                    site=site, slug=slug))[:1])
+            if infographics:
+                document = serialize_infographic(infographics[0])
+                if infographics[0].channel:
+                    channel_update = infographics[0].channel.date_update
+        request._infographics_detail_state = document
+        request._infographics_channel_update = channel_update
+    return request._infographics_detail_state
+
+
+def _date_update(document):
+    date_update = document['date_update']
+    if isinstance(date_update, basestring):
+        return parse_datetime(date_update)
+    return date_update
+
+
+def detail_last_modified(request, slug):
+    """
+    The channel is part of the document, so renaming it modifies the
+    infographic too
+    """
+    document = _infographic_state(request, slug)
+    if document:
+        dates = [d for d in (_date_update(document),
+                             request._infographics_channel_update) if d]
+        return max(dates)
+
+
+def detail_etag(request, slug):
+    document = _infographic_state(request, slug)
+    if document:
+        channel_update = request._infographics_channel_update
+        return md5(u'{0}:{1}:{2}'.format(
+            document['id'], _date_update(document).isoformat(),
+            channel_update.isoformat() if channel_update else u''
+        ).encode('utf-8')).hexdigest()
+
+
+def stream_list(queryset):
+    """
+    Serialize the list chunk by chunk, the whole payload is never built
+    in memory
+    """
+    encoder = DjangoJSONEncoder()
+    yield '{"results": ['
+    page = paginate(with_items(queryset), per_page=CHUNK_SIZE)
+    first = True
+    while True:
+        for infographic in page:
+            if not first:
+                yield ','
+            first = False
+            yield encoder.encode(serialize_infographic(infographic))
+        if not page.has_next:
+            break
+        page = paginate(with_items(queryset), page.next_cursor,
+                        per_page=CHUNK_SIZE)
+    yield ']}'
+
+
+@require_GET
+@condition(etag_func=list_etag, last_modified_func=list_last_modified)
+def infographic_list(request):
+    return StreamingHttpResponse(stream_list(published_infographics(request)),
+                                 content_type='application/json')
+
+
+@require_GET
+@condition(etag_func=detail_etag, last_modified_func=detail_last_modified)
+def infographic_detail(request, slug):
+    document = _infographic_state(request, slug)
+    if not document:
+        raise Http404
+    return HttpResponse(json.dumps(document, cls=DjangoJSONEncoder),
+                        content_type='application/json')
+
+
+def serialize_album_image(image):
+    return {
+        'id': image.pk,
+        'title': image.title,
+        'url': image.image.url,
+        'rendition': image_url(image.image.url, width=ALBUM_IMAGE_WIDTH),
+    }
+
+
+@require_GET
+def album_images(request, slug, item_slug):
+    """
+    One page of the album of a gallery item, ?offset=<n> walks the album
+    """
+    try:
+        offset = max(int(request.GET.get('offset', 0)), 0)
+    except ValueError:
+        raise Http404
+    albums = InfographicItem.objects.filter(
+        slug=item_slug,
+        album__isnull=False,
+        infographicitem_item__infographic__slug=slug,
+        infographicitem_item__infographic__site=get_resolver(request).site,
+        infographicitem_item__infographic__is_live=True,
+    ).values_list('album_id', flat=True)[:1]
+    if not albums:
+        raise Http404
+
+    images, has_more, next_offset = album_page(albums[0], offset)
+    next_url = None
+    if has_more:
+        next_url = u'{0}?offset={1}'.format(request.path, next_offset)
+    return HttpResponse(
+        json.dumps({'results': [serialize_album_image(image)
+                                for image in images if image.image],
+                    'next': next_url}),
+        content_type='application/json')
+
+
+def _timeline_state(request, pk):
+    if not hasattr(request, '_infographics_timeline_state'):
+        request._infographics_timeline_state = get_timeline(int(pk))
+    return request._infographics_timeline_state
+
+
+def timeline_etag(request, pk):
+    state = _timeline_state(request, pk)
+    if state:
+        return state[0]
+
+
+@require_GET
+@condition(etag_func=timeline_etag)
+def timeline_data(request, pk):
+    """
+    TimelineJS source of the timeline embeds, serialized ahead of time.
+    Timelines read from a source redirect to it.
+    """
+    state = _timeline_state(request, pk)
+    if not state:
+        sources = Timeline.objects.filter(pk=pk, source__gt=u'').values_list(
+            'source', flat=True)[:1]
+        if not sources:
+            raise Http404
+        return HttpResponseRedirect(sources[0])
+    return HttpResponse(state[1], content_type='application/json')
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+import re
+
+from django.conf import settings
+from django.core.cache import cache
+from django.template import Context, RequestContext
+from django.utils import timezone
+from django.utils.crypto import salted_hmac, constant_time_compare
+
+from .cache import box_cache_key
+from .loading import get_compiled_template
+from .models import InfographicBox
+from .resolvers import get_resolver
+
+
+BOX_CACHE_TIMEOUT = getattr(
+    settings, 'OPPS_INFOGRAPHICS_BOX_CACHE_TIMEOUT', 60 * 5)
+BOX_TEMPLATE = 'infographics/infographicbox_detail.html'
+
+# memberships, their infographic and its image, in two extra queries for
+# every box of the render
+BOX_PREFETCH = (
+    'infographicboxinfographics_infographicboxes__infographic__main_image',
+)
+
+PLACEHOLDER = re.compile(
+    r'<!--infographicbox:([-\w]+)\|([^|<>]*)\|([0-9a-f]{16})-->')
+
+
+def published_boxes(site):
+    return InfographicBox.objects.filter(
+        site=site,
+        published=True,
+        date_available__lte=timezone.now()
+    ).select_related('channel').prefetch_related(*BOX_PREFETCH)
+
+
+def load_boxes(site, slugs):
+    """
+    Return a {slug: box} dict of the published boxes in slugs, one query
+    for all of them
+    """
+    slugs = set(slugs)
+    if not slugs:
+        return {}
+    return dict((box.slug, box)
+                for box in published_boxes(site).filter(slug__in=slugs))
+
+
+def render_boxes(site, requested, context=None):
+    """
+    Render every (slug, template_name) of requested, reading what it can
+    from the cache and loading the rest with a single query
+    """
+    keys = dict((request, box_cache_key(site.id, *request))
+                for request in set(requested))
+    rendered = cache.get_many(keys.values())
+    missing = [request for request, key in keys.items()
+               if key not in rendered]
+
+    boxes = load_boxes(site, [slug for slug, template_name in missing])
+    for slug, template_name in missing:
+        t = get_compiled_template(template_name or BOX_TEMPLATE)
+        key = keys[(slug, template_name)]
+        rendered[key] = t.render(Context({'infographicbox': boxes.get(slug),
+                                          'slug': slug,
+                                          'context': context}))
+        cache.set(key, rendered[key], BOX_CACHE_TIMEOUT)
+
+    return dict((request, rendered[key]) for request, key in keys.items())
+
+
+def _signature(slug, template_name):
+    return salted_hmac('opps.infographics.boxes', u'{0}|{1}'.format(
+        slug, template_name)).hexdigest()[:16]
+
+
+def box_placeholder(slug, template_name=None):
+    """
+    Marker left in the page by the box tags, replaced by
+    InfographicBoxMiddleware. It is signed, so markers typed into content
+    are not rendered.
+    """
+    template_name = template_name or u''
+    return u'<!--infographicbox:{0}|{1}|{2}-->'.format(
+        slug, template_name, _signature(slug, template_name))
+
+
+def defer_boxes(request):
+    return getattr(request, '_infographics_defer_boxes', False)
+
+
+def replace_placeholders(request, content):
+    requested = []
+    for slug, template_name, signature in PLACEHOLDER.findall(content):
+        if constant_time_compare(signature,
+                                 _signature(slug, template_name)):
+            requested.append((slug, template_name))
+    if not requested:
+        return content
+
+    rendered = render_boxes(get_resolver(request).site, requested,
+                            RequestContext(request))
+
+    def replace(match):
+        slug, template_name, signature = match.groups()
+        return rendered.get((slug, template_name), match.group(0))
+    return PLACEHOLDER.sub(replace, content)
+
+
+class InfographicBoxMiddleware(object):
+    """
+    Two pass rendering of infographic boxes: the tags only leave a
+    placeholder and every box of the page is loaded with one query when
+    the response is done. Pages stored by the page cache keep their
+    placeholders, so boxes stay fresh on cached pages too.
+
+    Without this middleware the tags render each box right away.
+    """
+
+    def process_request(self, request):
+        request._infographics_defer_boxes = True
+
+    def process_response(self, request, response):
+        if (getattr(response, 'streaming', False) or
+                'text/html' not in response.get('Content-Type', '')):
+            return response
+
+        charset = getattr(response, '_charset', settings.DEFAULT_CHARSET)
+        content = response.content.decode(charset)
+        if u'<!--infographicbox:' not in content:
+            return response
+
+        response.content = replace_placeholders(
+            request, content).encode(charset)
+        if response.has_header('Content-Length'):
+            response['Content-Length'] = str(len(response.content))
+        return response
@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+import time
+import uuid
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+
+from .resolvers import get_resolver
+from .surrogate import SURROGATE_KEY_HEADER
+
+
+CACHE_ENABLED = getattr(settings, 'OPPS_INFOGRAPHICS_CACHE_ENABLED', False)
+CACHE_TIMEOUT = getattr(settings, 'OPPS_INFOGRAPHICS_CACHE_TIMEOUT', 60 * 15)
+CACHE_PREFIX = getattr(settings, 'OPPS_INFOGRAPHICS_CACHE_PREFIX',
+                       'opps_infographics')
+STALE_TIMEOUT = getattr(settings, 'OPPS_INFOGRAPHICS_CACHE_STALE_TIMEOUT',
+                        60 * 5)
+LOCK_TIMEOUT = getattr(settings, 'OPPS_INFOGRAPHICS_CACHE_LOCK_TIMEOUT', 30)
+LOCK_WAIT = getattr(settings, 'OPPS_INFOGRAPHICS_CACHE_LOCK_WAIT', 2)
+LOCK_POLL_INTERVAL = 0.05
+
+# generations must outlive the pages cached under them
+GENERATION_TIMEOUT = 60 * 60 * 24 * 30
+
+
+def _generation_key(site_id, slug=None, kind=None):
+    if kind is None:
+        kind = 'list' if slug is None else 'detail'
+    return u'{0}:gen:{1}:{2}:{3}'.format(CACHE_PREFIX, site_id, kind,
+                                         slug or u'')
+
+
+def get_generation(site_id, slug=None, kind=None):
+    """
+    Pages are cached under a generation number, bumping it invalidates
+    every page of that infographic (or every list page of the site) at once.
+    A generation lost by the cache backend restarts from the current time,
+    so it never goes back to a value already used.
+    """
+    key = _generation_key(site_id, slug, kind)
+    generation = cache.get(key)
+    if generation is None:
+        generation = int(time.time() * 1000)
+        if not cache.add(key, generation, GENERATION_TIMEOUT):
+            generation = cache.get(key, generation)
+    return generation
+
+
+def bump_generation(site_id, slug=None, kind=None):
+    key = _generation_key(site_id, slug, kind)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, int(time.time() * 1000), GENERATION_TIMEOUT)
+
+
+def invalidate_infographic(site_id, slug):
+    """
+    Drop the detail pages of one infographic and all list pages of its site
+    """
+    bump_generation(site_id, slug)
+    bump_generation(site_id)
+
+
+def fragment_cache_key(site_id, channel_slug, *args):
+    """
+    Key of a template tag fragment listing the infographics of a channel
+    (or of all channels when channel_slug is empty)
+    """
+    generation = get_generation(site_id, channel_slug, kind='fragment')
+    key = u':'.join(u'{0}'.format(part) for part in (
+        (site_id, channel_slug or u'', generation) + args))
+    return u'{0}:fragment:{1}'.format(
+        CACHE_PREFIX, md5(key.encode('utf-8')).hexdigest())
+
+
+def invalidate_fragments(site_id, channel_slug):
+    bump_generation(site_id, channel_slug, kind='fragment')
+
+
+def box_cache_key(site_id, slug, template_name):
+    """
+    Key of one rendered infographic box
+    """
+    generation = get_generation(site_id, slug, kind='box')
+    key = u':'.join(u'{0}'.format(part) for part in (
+        site_id, slug, generation, template_name))
+    return u'{0}:box:{1}'.format(
+        CACHE_PREFIX, md5(key.encode('utf-8')).hexdigest())
+
+
+def invalidate_box(site_id, slug):
+    bump_generation(site_id, slug, kind='box')
+
+
+def timeline_cache_key(timeline_id):
+    """
+    Key of the (etag, data) of a serialized timeline, overwritten whenever
+    the timeline is serialized again
+    """
+    return u'{0}:timeline:{1}'.format(CACHE_PREFIX, timeline_id)
+
+
+DETAIL_URL_NAMES = ('open_infographic', 'item_infographic')
+
+# response headers kept along with the cached content
+CACHED_HEADERS = (SURROGATE_KEY_HEADER,)
+
+
+def page_cache_key(site_id, url_name, slug=None, item_slug=None, page=None):
+    key = u':'.join(u'{0}'.format(part) for part in (
+        site_id, url_name, slug, item_slug, page))
+    return u'{0}:page:{1}'.format(
+        CACHE_PREFIX, md5(key.encode('utf-8')).hexdigest())
+
+
+def _release_lock(lock_key, token):
+    """
+    Delete the lock only while it still holds token: once it expired,
+    another worker may have taken it for its own rendering
+    """
+    if cache.get(lock_key) == token:
+        cache.delete(lock_key)
+
+
+def _build_response(cached):
+    response = HttpResponse(cached['content'],
+                            content_type=cached['content_type'])
+    for header, value in cached['headers'].items():
+        response[header] = value
+    return response
+
+
+class CachedPageMixin(object):
+    """
+    Opt-in full page cache (OPPS_INFOGRAPHICS_CACHE_ENABLED), keyed by site,
+    url name, slug, item_slug and page cursor. Invalidated by the model signals in
+    opps.infographics.signals
+
+    Only one worker regenerates a missing or stale page, through a lock kept
+    in the shared cache. While it renders, the other workers serve the stale
+    copy (up to OPPS_INFOGRAPHICS_CACHE_STALE_TIMEOUT after it expired) or,
+    when there is none, wait up to OPPS_INFOGRAPHICS_CACHE_LOCK_WAIT seconds
+    for the fresh one.
+    """
+
+    def bypass_page_cache(self, request):
+        return False
+
+    def get_page_cache_key(self, request, *args, **kwargs):
+        """
+        Return a (key, generation) tuple, or None when the page must not
+        be cached
+        """
+        if not CACHE_ENABLED or request.method != 'GET':
+            return None
+        if self.bypass_page_cache(request):
+            return None
+
+        resolver_match = getattr(request, 'resolver_match', None)
+        url_name = getattr(resolver_match, 'url_name', None)
+        if not url_name:
+            url_name = self.__class__.__name__
+
+        if request.GET.get('format') == 'json':
+            url_name = u'{0}.json'.format(url_name)
+
+        site = get_resolver(request).site
+        slug = kwargs.get('slug', kwargs.get('channel__long_slug'))
+        key = page_cache_key(
+            site.id,
+            url_name,
+            slug=slug,
+            item_slug=kwargs.get('item_slug'),
+            page=request.GET.get('cursor')
+        )
+        generation = get_generation(
+            site.id, slug if url_name in DETAIL_URL_NAMES else None)
+        return key, generation
+
+    def wait_page_cache(self, key, generation):
+        deadline = time.time() + LOCK_WAIT
+        while time.time() < deadline:
+            time.sleep(LOCK_POLL_INTERVAL)
+            cached = cache.get(key)
+            if cached is not None and cached['generation'] == generation:
+                return cached
+        return None
+
+    def dispatch(self, request, *args, **kwargs):
+        page_cache = self.get_page_cache_key(request, *args, **kwargs)
+        if not page_cache:
+            return super(CachedPageMixin, self).dispatch(
+                request, *args, **kwargs)
+
+        key, generation = page_cache
+        now = time.time()
+        cached = cache.get(key)
+        if cached is not None:
+            if (cached['generation'] == generation and
+                    now < cached['fresh_until']):
+                return _build_response(cached)
+            if now >= cached['stale_until']:
+                cached = None
+
+        lock_key = u'{0}:lock'.format(key)
+        token = uuid.uuid4().hex
+        locked = cache.add(lock_key, token, LOCK_TIMEOUT)
+        if not locked:
+            # somebody else is already rendering this page
+            if cached is not None:
+                return _build_response(cached)
+            cached = self.wait_page_cache(key, generation)
+            if cached is not None:
+                return _build_response(cached)
+
+        try:
+            response = super(CachedPageMixin, self).dispatch(
+                request, *args, **kwargs)
+
+            if response.status_code == 200:
+                if hasattr(response, 'render') and callable(response.render):
+                    response.render()
+                now = time.time()
+                cache.set(key, {'content': response.content,
+                                'content_type': response['Content-Type'],
+                                'headers': dict(
+                                    (header, response[header])
+                                    for header in CACHED_HEADERS
+                                    if response.has_header(header)),
+                                'generation': generation,
+                                'fresh_until': now + CACHE_TIMEOUT,
+                                'stale_until': (now + CACHE_TIMEOUT +
+                                                STALE_TIMEOUT)},
+                          CACHE_TIMEOUT + STALE_TIMEOUT)
+            else:
+                cache.delete(key)
+        finally:
+            if locked:
+                _release_lock(lock_key, token)
+
+        return response
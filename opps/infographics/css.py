@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+import re
+from hashlib import sha1
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+
+CSS_PATH = getattr(settings, 'OPPS_INFOGRAPHICS_CSS_PATH', 'infographics/css')
+
+COMMENTS = re.compile(r'/\*.*?\*/', re.DOTALL)
+SPACES = re.compile(r'\s+')
+SPACES_AROUND = re.compile(r'\s*([{};,>])\s*')
+SPACES_AFTER = re.compile(r'([:(])\s+')
+EMPTY_RULES = re.compile(r'[^{}]+\{\}')
+
+
+def minify(css):
+    css = COMMENTS.sub(u'', css)
+    css = SPACES.sub(u' ', css)
+    css = SPACES_AROUND.sub(r'\1', css)
+    css = SPACES_AFTER.sub(r'\1', css)
+    css = css.replace(u';}', u'}')
+    # removing a rule can leave its @media block empty
+    previous = None
+    while previous != css:
+        previous = css
+        css = EMPTY_RULES.sub(u'', css)
+    return css.strip()
+
+
+def bundle_path(css_hash):
+    return u'{0}/{1}.css'.format(CSS_PATH, css_hash)
+
+
+def bundle_url(css_hash):
+    return default_storage.url(bundle_path(css_hash))
+
+
+def build_bundle(infographic, items=None):
+    """
+    Combine and minify the css of infographic (the default CSS_TEXT when
+    blank) and of its items, save it once per content hash and return the
+    hash. Bundles never change, so they can be served with a long cache.
+    """
+    from .models import CSS_TEXT
+
+    if items is None:
+        items = infographic.items.all()
+
+    parts = [infographic.css_text or CSS_TEXT]
+    parts.extend(item.css_text for item in items if item.css_text)
+    css = minify(u'\n'.join(parts))
+    if not css:
+        return None
+
+    css_hash = sha1(css.encode('utf-8')).hexdigest()
+    path = bundle_path(css_hash)
+    if not default_storage.exists(path):
+        name = default_storage.save(path, ContentFile(css.encode('utf-8')))
+        if name != path:
+            # saved concurrently by another process, keep a single copy
+            default_storage.delete(name)
+    return css_hash
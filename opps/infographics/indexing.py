@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+from multiprocessing import Pool
+
+from django.db import connection, reset_queries
+from django.db.models import get_model
+
+from haystack import connections as haystack_connections
+from haystack.constants import DEFAULT_ALIAS
+
+
+# objects loaded, prepared and sent to the backend at once
+CHUNK_SIZE = 500
+
+
+def model_label(model):
+    return u'{0}.{1}'.format(model._meta.app_label, model._meta.module_name)
+
+
+def _index(label, using):
+    model = get_model(*label.split('.'))
+    unified_index = haystack_connections[using].get_unified_index()
+    return unified_index.get_index(model)
+
+
+def index_chunk(args):
+    """
+    Load one chunk of objects with a single query, and send their documents
+    to the backend in one request. Runs in the pool processes.
+    """
+    label, pks, using = args
+    index = _index(label, using)
+    backend = haystack_connections[using].get_backend()
+    objects = list(index.load_chunk(pks, using=using))
+    if objects:
+        backend.update(index, objects)
+    # DEBUG keeps every query in memory
+    reset_queries()
+    return len(objects)
+
+
+def changed(index, since=None, using=None):
+    """
+    Return the pks to index and the pks to remove from the index: objects
+    of index changed since (all of them when since is None) and no longer
+    in index_queryset
+    """
+    queryset = index.build_queryset(using=using, start_date=since)
+    pks = list(queryset.values_list('pk', flat=True))
+    stale = []
+    if since is not None:
+        updated = index.get_model()._default_manager.filter(**{
+            '{0}__gte'.format(index.get_updated_field()): since})
+        stale = list(updated.exclude(pk__in=pks).values_list('pk', flat=True))
+    return pks, stale
+
+
+def update_index(index, pks, stale=(), chunk_size=CHUNK_SIZE, processes=1,
+                 using=DEFAULT_ALIAS):
+    """
+    Index pks in chunks of chunk_size, with a pool of processes when there
+    are several chunks, and remove stale from the index. Return the number
+    of documents sent.
+    """
+    label = model_label(index.get_model())
+    jobs = [(label, pks[i:i + chunk_size], using)
+            for i in range(0, len(pks), chunk_size)]
+    if processes > 1 and len(jobs) > 1:
+        # every process opens its own database connection
+        connection.close()
+        pool = Pool(processes)
+        try:
+            counts = pool.map(index_chunk, jobs)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        counts = [index_chunk(job) for job in jobs]
+
+    backend = haystack_connections[using].get_backend()
+    for pk in stale:
+        backend.remove(u'{0}.{1}'.format(label, pk))
+    return sum(counts)
+
+
+def remove_documents(model, pks):
+    """
+    Remove the documents of pks of model from every connection, for the
+    deleted objects that incremental runs never see again
+    """
+    label = model_label(model)
+    for connection in haystack_connections.all():
+        backend = connection.get_backend()
+        for pk in pks:
+            backend.remove(u'{0}.{1}'.format(label, pk))
+
+
+def prepare_documents(args):
+    label, objects, using = args
+    index = _index(label, using)
+    return [index.full_prepare(obj) for obj in objects]
+
+
+def build_documents(index, objects, processes=1, chunk_size=CHUNK_SIZE,
+                    using=DEFAULT_ALIAS):
+    """
+    Documents of objects, prepared in a pool of processes, for benchmarks
+    """
+    label = model_label(index.get_model())
+    jobs = [(label, objects[i:i + chunk_size], using)
+            for i in range(0, len(objects), chunk_size)]
+    if processes > 1 and len(jobs) > 1:
+        pool = Pool(processes)
+        try:
+            chunks = pool.map(prepare_documents, jobs)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        chunks = [prepare_documents(job) for job in jobs]
+    return [document for chunk in chunks for document in chunk]
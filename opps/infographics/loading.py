@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+import time
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.template import TemplateDoesNotExist
+from django.template.loader import find_template, get_template
+
+from .cache import CACHE_PREFIX
+
+
+# seconds between checks of the deploy generation in the shared cache
+TEMPLATE_CACHE_CHECK = getattr(
+    settings, 'OPPS_INFOGRAPHICS_TEMPLATE_CACHE_CHECK', 60)
+
+# resolved keys kept per process, the memo starts over when it is full
+TEMPLATE_CACHE_SIZE = getattr(
+    settings, 'OPPS_INFOGRAPHICS_TEMPLATE_CACHE_SIZE', 20000)
+
+GENERATION_KEY = u'{0}:templates:generation'.format(CACHE_PREFIX)
+
+_lock = threading.Lock()
+_resolved = {}
+_missing = set()
+_compiled = {}
+_generation = {'value': None, 'checked_at': 0}
+
+
+def clear_template_cache():
+    """
+    Forget resolved and missing templates of the current process
+    """
+    with _lock:
+        _resolved.clear()
+        _missing.clear()
+        _compiled.clear()
+
+
+def invalidate_template_cache():
+    """
+    Make every process resolve its templates again, call it when templates
+    are deployed (see the clear_infographics_templates command)
+    """
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, int(time.time()), 60 * 60 * 24 * 365)
+    clear_template_cache()
+
+
+def _check_generation():
+    now = time.time()
+    if now - _generation['checked_at'] < TEMPLATE_CACHE_CHECK:
+        return
+    _generation['checked_at'] = now
+    generation = cache.get(GENERATION_KEY)
+    if generation != _generation['value']:
+        _generation['value'] = generation
+        clear_template_cache()
+
+
+def _exists(name):
+    try:
+        find_template(name)
+    except TemplateDoesNotExist:
+        return False
+    return True
+
+
+def _first_existing(candidates):
+    for name in candidates():
+        if name in _missing:
+            continue
+        if _exists(name):
+            return name
+        _missing.add(name)
+    return None
+
+
+def resolve_template_name(key, candidates):
+    """
+    Return the first existing template of candidates() (a callable returning
+    a list of names), or None. The result is memoized under key, and names
+    known to be missing are never looked up again, saving the loaders'
+    filesystem probes on every request.
+    """
+    if settings.DEBUG:
+        # templates change all the time in development
+        for name in candidates():
+            if _exists(name):
+                return name
+        return None
+
+    _check_generation()
+    try:
+        return _resolved[key]
+    except KeyError:
+        pass
+
+    if len(_resolved) >= TEMPLATE_CACHE_SIZE:
+        clear_template_cache()
+
+    resolved = _first_existing(candidates)
+    with _lock:
+        _resolved[key] = resolved
+    return resolved
+
+
+def get_compiled_template(name):
+    """
+    get_template(name), compiled once per process
+    """
+    if settings.DEBUG:
+        return get_template(name)
+
+    _check_generation()
+    try:
+        return _compiled[name]
+    except KeyError:
+        pass
+
+    compiled = get_template(name)
+    with _lock:
+        _compiled[name] = compiled
+    return compiled
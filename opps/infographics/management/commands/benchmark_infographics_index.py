@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import json
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+from django.template import Context, Template
+from django.utils import timezone
+
+from haystack import connections
+from haystack.constants import DEFAULT_ALIAS
+
+from opps.channels.models import Channel
+from opps.infographics.indexing import build_documents
+from opps.infographics.models import Infographic
+from opps.infographics.search_indexes import InfographicIndex
+
+
+# search/indexes/infographics/infographic_text.txt, the document the index
+# used to render before prepare_text
+TEXT_TEMPLATE = u"""{{ object.title }}
+{{ object.title|slugify }}
+{{ object.title|safe }}
+{{ object.title|striptags }}
+{{ object.headline }}
+{{ object.headline|slugify }}
+{{ object.headline|safe }}
+{{ object.headline|striptags }}
+{{ object.description }}
+{{ object.description|slugify }}
+{{ object.description|safe }}
+{{ object.description|striptags }}
+{% for tag in object.tags.all %}
+{{tag.name}}\\n
+{{tag.name|slugify}}\\n
+{% endfor %}"""
+
+WORDS = (u'lorem ipsum dolor sit amet consectetur adipiscing elit sed do '
+         u'eiusmod tempor incididunt ut labore et dolore magna aliqua').split()
+
+
+def _text(i, words):
+    return u' '.join(WORDS[(i + n) % len(WORDS)] for n in range(words))
+
+
+def synthetic_corpus(count):
+    """
+    Unsaved infographics shaped like the real ones, nothing is written to
+    the database
+    """
+    now = timezone.now()
+    channels = [Channel(pk=i + 1, name=u'Channel {0}'.format(i),
+                        slug=u'channel-{0}'.format(i),
+                        long_slug=u'channel-{0}'.format(i))
+                for i in range(10)]
+    corpus = []
+    for i in range(count):
+        infographic = Infographic(
+            pk=i + 1, site_id=1, user_id=1, published=True, is_live=True,
+            title=_text(i, 8), slug=u'infographic-{0}'.format(i),
+            headline=_text(i, 20),
+            description=u'<p>{0}</p><p><strong>{1}</strong></p>'.format(
+                _text(i, 120), _text(i + 3, 40)),
+            tags=u','.join(WORDS[(i + n) % len(WORDS)] for n in range(5)),
+            type=Infographic.TYPES[i % len(Infographic.TYPES)][0],
+            date_available=now, date_update=now)
+        infographic.channel = channels[i % len(channels)]
+        corpus.append(infographic)
+    return corpus
+
+
+class TemplateInfographicIndex(InfographicIndex):
+    """
+    InfographicIndex with the text rendered from the old template
+    """
+    text_template = Template(TEXT_TEMPLATE)
+
+    def prepare_text(self, obj):
+        return self.text_template.render(Context({'object': obj}))
+
+
+def template_documents(corpus):
+    index = TemplateInfographicIndex()
+    return [index.full_prepare(obj) for obj in corpus]
+
+
+class Command(BaseCommand):
+    help = (u'Time the preparation of infographic search documents on a '
+            u'synthetic corpus, and report their size')
+
+    option_list = BaseCommand.option_list + (
+        make_option('--count', '-n',
+                    dest='count',
+                    type='int',
+                    default=10000,
+                    help=u'Number of synthetic infographics'),
+        make_option('--processes', '-p',
+                    dest='processes',
+                    type='int',
+                    default=4,
+                    help=u'Number of processes of the parallel run'),
+        make_option('--template',
+                    action='store_true',
+                    dest='template',
+                    default=False,
+                    help=u'Time the old template rendered document first'),
+    )
+
+    def report(self, index, name, documents, elapsed):
+        size = sum(len(json.dumps(document, cls=DjangoJSONEncoder))
+                   for document in documents)
+        text = sum(len(document[index.get_content_field()])
+                   for document in documents)
+        self.stdout.write(
+            u'{0}: {1} docs in {2:.2f}s ({3:.0f} docs/s), '
+            u'{4} bytes, {5} bytes of text'.format(
+                name, len(documents), elapsed,
+                len(documents) / elapsed if elapsed else 0, size, text))
+
+    def handle(self, **options):
+        index = connections[DEFAULT_ALIAS].get_unified_index().get_index(
+            Infographic)
+        corpus = synthetic_corpus(options['count'])
+
+        if options['template']:
+            started = time.time()
+            documents = template_documents(corpus)
+            self.report(index, u'template, 1 process', documents,
+                        time.time() - started)
+
+        for processes in sorted(set([1, options['processes']])):
+            started = time.time()
+            documents = build_documents(index, corpus, processes=processes)
+            self.report(index, u'{0} process(es)'.format(processes),
+                        documents, time.time() - started)
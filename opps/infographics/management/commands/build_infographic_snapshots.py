@@ -0,0 +1,34 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from opps.infographics.models import Infographic, InfographicSnapshot
+from opps.infographics.snapshot import update_snapshots
+
+
+class Command(BaseCommand):
+    help = (u'Build the snapshots of every live infographic, they are kept '
+            u'up to date on save afterwards')
+
+    option_list = BaseCommand.option_list + (
+        make_option('--chunk-size',
+                    type='int',
+                    dest='chunk_size',
+                    default=100,
+                    help=u'Infographics loaded per query'),
+    )
+
+    def handle(self, **options):
+        chunk_size = options['chunk_size']
+        InfographicSnapshot.objects.exclude(
+            infographic__is_live=True).delete()
+
+        pks = list(Infographic.objects.filter(
+            is_live=True).order_by('pk').values_list('pk', flat=True))
+        for i in range(0, len(pks), chunk_size):
+            update_snapshots(Infographic.objects.filter(
+                pk__in=pks[i:i + chunk_size]))
+
+        self.stdout.write(u'Built {0} infographic snapshots'.format(len(pks)))
@@ -0,0 +1,14 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from django.core.management.base import NoArgsCommand
+
+from opps.infographics.loading import invalidate_template_cache
+
+
+class Command(NoArgsCommand):
+    help = (u'Make every process resolve infographic templates again, '
+            u'run it after deploying templates')
+
+    def handle_noargs(self, **options):
+        invalidate_template_cache()
+        self.stdout.write(u'Infographic template cache invalidated')
@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import json
+import time
+from multiprocessing import Pool
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.urlresolvers import reverse, resolve
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.sites.models import Site
+from django.db import connection
+from django.test.client import RequestFactory
+
+from opps.infographics.models import Infographic, InfographicInfographicItem
+
+
+STATE_FILE = '.infographics_export.json'
+
+
+def infographic_paths(slug, item_slugs):
+    paths = [reverse('infographics:open_infographic',
+                     kwargs={'slug': slug})]
+    for item_slug in item_slugs:
+        paths.append(reverse('infographics:item_infographic',
+                             kwargs={'slug': slug, 'item_slug': item_slug}))
+    return paths
+
+
+def path_to_file(output_dir, path):
+    return os.path.join(output_dir, path.strip('/'), 'index.html')
+
+
+def render_path(path):
+    """
+    Render one url through the same view (and template resolution) used to
+    serve it, as an anonymous user
+    """
+    request = RequestFactory().get(path)
+    request.user = AnonymousUser()
+    match = resolve(path)
+    response = match.func(request, *match.args, **match.kwargs)
+    if hasattr(response, 'render') and callable(response.render):
+        response.render()
+    return response
+
+
+def export_path(args):
+    output_dir, path = args
+    try:
+        response = render_path(path)
+    except Exception as e:
+        return path, u'{0}: {1}'.format(e.__class__.__name__, e)
+
+    if response.status_code != 200:
+        return path, u'HTTP {0}'.format(response.status_code)
+
+    filename = path_to_file(output_dir, path)
+    dirname = os.path.dirname(filename)
+    if not os.path.isdir(dirname):
+        os.makedirs(dirname)
+
+    # write then rename, the web server never sees a half written file
+    with open(filename + '.tmp', 'wb') as f:
+        f.write(response.content)
+    os.rename(filename + '.tmp', filename)
+    return path, None
+
+
+def remove_path(output_dir, path):
+    filename = path_to_file(output_dir, path)
+    if os.path.exists(filename):
+        os.remove(filename)
+    try:
+        os.removedirs(os.path.dirname(filename))
+    except OSError:
+        pass  # directory not empty
+
+
+class Command(BaseCommand):
+    args = '<output_dir>'
+    help = (u'Render published infographics and their items to static '
+            u'html files, to be served by the web server or a CDN origin')
+
+    option_list = BaseCommand.option_list + (
+        make_option('--processes', '-p',
+                    dest='processes',
+                    type='int',
+                    default=4,
+                    help=u'Number of render processes (default 4)'),
+        make_option('--incremental', '-i',
+                    action='store_true',
+                    dest='incremental',
+                    default=False,
+                    help=u'Only render infographics changed since the '
+                         u'last run'),
+    )
+
+    def handle(self, *args, **options):
+        if len(args) != 1:
+            raise CommandError(u'Usage: export_infographics <output_dir>')
+
+        output_dir = os.path.abspath(args[0])
+        if not os.path.isdir(output_dir):
+            os.makedirs(output_dir)
+
+        started = time.time()
+        state_file = os.path.join(output_dir, STATE_FILE)
+        old_state = {}
+        if os.path.exists(state_file):
+            with open(state_file) as f:
+                old_state = json.load(f)
+
+        state, paths = self.build_state(old_state, options['incremental'])
+
+        # files for unpublished infographics and removed items
+        removed = 0
+        for pk, entry in old_state.items():
+            current = set(state.get(pk, {}).get('paths', []))
+            for path in entry['paths']:
+                if path not in current:
+                    remove_path(output_dir, path)
+                    removed += 1
+
+        errors = set()
+        jobs = [(output_dir, path) for path in paths]
+        processes = options['processes']
+        if processes > 1 and len(jobs) > 1:
+            # every process opens its own database connection
+            connection.close()
+            pool = Pool(processes)
+            try:
+                results = pool.map(export_path, jobs, chunksize=50)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            results = [export_path(job) for job in jobs]
+
+        for path, error in results:
+            if error:
+                errors.add(path)
+                self.stderr.write(u'{0} {1}'.format(path, error))
+
+        # failed pages are rendered again on the next run
+        for pk, entry in state.items():
+            if any(path in errors for path in entry['paths']):
+                entry['signature'] = None
+
+        with open(state_file + '.tmp', 'w') as f:
+            json.dump(state, f)
+        os.rename(state_file + '.tmp', state_file)
+
+        self.stdout.write(
+            u'Rendered {0} pages ({1} errors), removed {2} in {3:.1f}s'.format(
+                len(paths) - len(errors), len(errors), removed,
+                time.time() - started))
+
+    def build_state(self, old_state, incremental):
+        """
+        Return the export state of all published infographics of the current
+        site, and the list of paths that must be rendered
+        """
+        published = Infographic.objects.all_published().filter(
+            site=Site.objects.get_current())
+        infographics = published.values_list('id', 'slug', 'date_update')
+
+        items = {}
+        memberships = InfographicInfographicItem.objects.filter(
+            infographic__in=published,
+            item__isnull=False,
+        ).values_list('infographic_id', 'item__slug')
+        for infographic_id, item_slug in memberships:
+            items.setdefault(infographic_id, []).append(item_slug)
+
+        state = {}
+        paths = []
+        for pk, slug, date_update in infographics:
+            item_slugs = sorted(items.get(pk, []))
+            # items have no date_update, membership changes count as well
+            signature = u'{0}|{1}'.format(date_update.isoformat(),
+                                          u','.join(item_slugs))
+            entry = {'signature': signature,
+                     'paths': infographic_paths(slug, item_slugs)}
+            # json keys are always strings
+            state[str(pk)] = entry
+
+            old_entry = old_state.get(str(pk))
+            if (incremental and old_entry and
+                    old_entry['signature'] == signature):
+                continue
+            paths.extend(entry['paths'])
+
+        return state, paths
@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from haystack.constants import DEFAULT_ALIAS
+
+from opps.infographics.search_queue import flush, BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = (u'Send the infographics and items queued by '
+            u'QueuedSignalProcessor to the search backend, run it from cron '
+            u'or as a worker with --interval')
+
+    option_list = BaseCommand.option_list + (
+        make_option('--batch-size', '-b',
+                    type='int',
+                    dest='batch_size',
+                    default=BATCH_SIZE,
+                    help=u'Queue entries sent per backend request'),
+        make_option('--interval',
+                    type='int',
+                    dest='interval',
+                    default=0,
+                    help=u'Keep running, checking the queue every INTERVAL '
+                         u'seconds once it is empty'),
+        make_option('--using', '-u',
+                    dest='using',
+                    default=DEFAULT_ALIAS,
+                    help=u'Haystack connection to update'),
+    )
+
+    def handle(self, **options):
+        interval = options['interval']
+        while True:
+            while True:
+                updated, removed = flush(options['batch_size'],
+                                         using=options['using'])
+                if not updated and not removed:
+                    break
+                self.stdout.write(u'Indexed {0} documents, removed {1}'.format(
+                    updated, removed))
+            if interval <= 0:
+                break
+            time.sleep(interval)
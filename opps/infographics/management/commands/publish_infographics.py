@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from opps.infographics.scheduler import update_live, next_change
+
+
+class Command(BaseCommand):
+    help = (u'Put scheduled infographics live when their date_available '
+            u'arrives, run it from cron or as a worker with --interval')
+
+    option_list = BaseCommand.option_list + (
+        make_option('--interval',
+                    type='int',
+                    dest='interval',
+                    default=0,
+                    help=u'Keep running, waking up at least every INTERVAL '
+                         u'seconds and exactly when the next infographic is '
+                         u'due'),
+    )
+
+    def handle(self, **options):
+        interval = options['interval']
+        while True:
+            went_live, went_offline = update_live()
+            if went_live or went_offline:
+                self.stdout.write(
+                    u'{0} infographics went live, {1} offline'.format(
+                        went_live, went_offline))
+            if interval <= 0:
+                break
+
+            now = timezone.now()
+            wait = interval
+            due = next_change(now)
+            if due is not None:
+                wait = min(wait, max((due - now).total_seconds(), 0))
+            time.sleep(wait)
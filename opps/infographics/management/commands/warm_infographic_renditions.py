@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.db.models.query import prefetch_related_objects
+
+from opps.infographics.cache import invalidate_infographic
+from opps.infographics.menu import menu_items
+from opps.infographics.models import Infographic
+from opps.infographics.renditions import build_renditions, rendition_urls
+from opps.infographics.snapshot import SNAPSHOT_PREFETCH, update_snapshots
+from opps.infographics.surrogate import purge, purge_batch, infographic_key
+from opps.infographics.warmup import warm_renditions, WARMUP_THREADS
+
+
+class Command(BaseCommand):
+    help = (u'Build the rendition map of every published infographic, live '
+            u'or scheduled, and generate its renditions on the image server')
+
+    option_list = BaseCommand.option_list + (
+        make_option('--threads',
+                    type='int',
+                    dest='threads',
+                    default=WARMUP_THREADS,
+                    help=u'Renditions requested in parallel'),
+        make_option('--chunk-size',
+                    type='int',
+                    dest='chunk_size',
+                    default=100,
+                    help=u'Infographics loaded per query'),
+    )
+
+    def handle(self, **options):
+        chunk_size = options['chunk_size']
+        pks = list(Infographic.objects.filter(
+            published=True).order_by('pk').values_list('pk', flat=True))
+
+        urls = set()
+        for i in range(0, len(pks), chunk_size):
+            infographics = list(Infographic.objects.filter(
+                pk__in=pks[i:i + chunk_size]))
+            prefetch_related_objects(infographics, SNAPSHOT_PREFETCH)
+            touched = []
+            for infographic in infographics:
+                renditions = build_renditions(infographic,
+                                              menu_items(infographic))
+                if renditions != infographic.renditions:
+                    infographic.renditions = renditions
+                    Infographic.objects.filter(pk=infographic.pk).update(
+                        renditions=renditions)
+                    touched.append(infographic)
+                urls.update(rendition_urls(renditions))
+            # update() sends no signal, the snapshots and pages of the rows
+            # touched carry the old map
+            update_snapshots(touched)
+            with purge_batch():
+                for infographic in touched:
+                    invalidate_infographic(infographic.site_id,
+                                           infographic.slug)
+                    purge(infographic_key(infographic.pk))
+
+        failed = warm_renditions(sorted(urls), threads=options['threads'])
+        for url in failed:
+            self.stderr.write(u'Failed: {0}'.format(url))
+        self.stdout.write(u'Warmed {0} of {1} renditions of {2} '
+                          u'infographics'.format(len(urls) - len(failed),
+                                                 len(urls), len(pks)))
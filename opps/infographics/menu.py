@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+from django.db.models.query import prefetch_related_objects
+
+
+# memberships with their item, enough to build the menu and the css bundle
+MENU_PREFETCH = 'infographicitem_infographic__item'
+
+
+def menu_items(infographic):
+    """
+    Items of infographic in menu order: membership order, then item order.
+    Uses the memberships prefetched with MENU_PREFETCH.
+    """
+    memberships = sorted(infographic.infographicitem_infographic.all(),
+                         key=lambda m: (m.order, m.item.order, m.item_id))
+    return [membership.item for membership in memberships]
+
+
+def build_menu(items):
+    """
+    Return the menu entries of items, a list of {'group', 'items'} dicts.
+    Items sharing a group are listed together, in a submenu placed where
+    the first of them is, items without a group get an entry of their own.
+    """
+    menu = []
+    groups = {}
+    for item in items:
+        link = {'title': item.title, 'slug': item.slug}
+        if not item.group:
+            menu.append({'group': None, 'items': [link]})
+        elif item.group in groups:
+            groups[item.group]['items'].append(link)
+        else:
+            groups[item.group] = {'group': item.group, 'items': [link]}
+            menu.append(groups[item.group])
+    return menu
+
+
+def prefetch_menu(infographics):
+    prefetch_related_objects(infographics, [MENU_PREFETCH])
+    return infographics
@@ -1,12 +1,20 @@
 # -*- coding: utf-8 -*-
 from django.conf import settings
+from django.contrib.sites.managers import CurrentSiteManager
 from django.db import models
+from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 from django.core.urlresolvers import reverse
 
+from opps.core.managers import PublishableManager, PublishableQuerySet
 from opps.core.models import Publishable
 from opps.core.models import Slugged
 from opps.core.tags.models import Tagged
+from opps.boxes.models import BaseBox
+
+from jsonfield import JSONField
+
+from .css import bundle_url
 
 app_namespace = getattr(settings, 'OPPS_INFOGRAPHICS_URL_NAMESPACE', 'infographics')
 
@@ -59,6 +67,26 @@ CSS_TEXT = getattr(
 )
 
 
+class InfographicQuerySet(PublishableQuerySet):
+
+    def all_published(self):
+        """
+        Published infographics whose date_available has arrived, from the
+        is_live flag kept by the publish_infographics command
+        """
+        return self.filter(is_live=True)
+
+
+class InfographicManager(PublishableManager):
+    queryset_class = InfographicQuerySet
+
+    def get_query_set(self):
+        return self.queryset_class(self.model, using=self._db)
+
+    def all_published(self):
+        return self.get_query_set().all_published()
+
+
 class Infographic(Publishable, Slugged, Tagged):
 
     TYPES = (
@@ -117,14 +145,28 @@ class Infographic(Publishable, Slugged, Tagged):
         through='InfographicInfographicItem'
     )
 
+    # menu entries, in menu order, rebuilt when the infographic, its items
+    # or their memberships change. See opps.infographics.menu
+    menu = JSONField(null=True, blank=True, editable=False)
+    # rendition urls of every image shown, by image url and size, rebuilt
+    # along with the menu. See opps.infographics.renditions
+    renditions = JSONField(null=True, blank=True, editable=False)
+
     # css
+    # blank means CSS_TEXT, it is no longer copied into every row
     css_text = models.TextField(
         _(u"CSS"),
         blank=True,
         null=True,
-        default=CSS_TEXT,
         help_text=_(u'Custom in-page css applied in all infographics type')
     )
+    # content hash of the minified css bundle (infographic + items css)
+    css_hash = models.CharField(
+        max_length=40,
+        null=True,
+        blank=True,
+        editable=False
+    )
 
     css_path = models.CharField(
         _(u"Custom css path"),
@@ -153,15 +195,45 @@ class Infographic(Publishable, Slugged, Tagged):
         help_text=_(u'Set this and provide JSON, DOC or Events')
     )
 
+    # published and date_available reached, set on save and flipped by the
+    # publish_infographics command when date_available arrives
+    is_live = models.BooleanField(
+        _(u"Live"),
+        default=False,
+        db_index=True,
+        editable=False
+    )
+
+    # set by the admin on an infographic going live, which stays offline
+    # until its renditions are warm
+    hold_live = False
+
+    objects = InfographicManager()
+    # declared again after objects, which must stay the default manager
+    on_site = CurrentSiteManager()
+
     def __unicode__(self):
         return self.title
 
     class Meta:
         ordering = ['order']
         unique_together = ['site', 'slug']
+        # public lists, by site and by channel, in their list ordering
+        index_together = [
+            ['site', 'is_live', 'order', 'date_available', 'id'],
+            ['channel', 'is_live', 'order', 'date_available', 'id'],
+        ]
         verbose_name = _(u'Infographic')
         verbose_name_plural = _(u'Infographics')
 
+    def save(self, *args, **kwargs):
+        self.is_live = self.should_be_live() and not self.hold_live
+        super(Infographic, self).save(*args, **kwargs)
+
+    def should_be_live(self, now=None):
+        return bool(self.published and self.date_available and
+                    self.date_available <= (now or timezone.now()))
+
     def get_absolute_url(self):
         return reverse(
             '{0}:open_infographic'.format(app_namespace),
@@ -171,6 +243,11 @@ class Infographic(Publishable, Slugged, Tagged):
     def get_thumb(self):
         return self.main_image
 
+    @property
+    def css_url(self):
+        if self.css_hash:
+            return bundle_url(self.css_hash)
+
     @property
     def search_category(self):
         return _("Infographic")
@@ -180,23 +257,29 @@ class InfographicInfographicItem(models.Model):
     item = models.ForeignKey(
         'infographics.InfographicItem',
         verbose_name=_(u'Infographic Item'),
-        null=True,
-        blank=True,
-        related_name='infographicitem_item',
-        on_delete=models.SET_NULL
+        related_name='infographicitem_item'
     )
     infographic = models.ForeignKey(
         'infographics.Infographic',
         verbose_name=_(u'Infographic'),
-        null=True,
-        blank=True,
-        related_name='infographicitem_infographic',
-        on_delete=models.SET_NULL
+        related_name='infographicitem_infographic'
     )
+    order = models.IntegerField(_(u"Order"), default=0)
 
     def __unicode__(self):
         return u"{0}-{1}".format(self.infographic.slug, self.item.title)
 
+    def get_absolute_url(self):
+        return reverse(
+            '{0}:item_infographic'.format(app_namespace),
+            kwargs={'slug': self.infographic.slug,
+                    'item_slug': self.item.slug}
+        )
+
+    class Meta:
+        ordering = ('order',)
+        unique_together = [['infographic', 'item']]
+
 
 class InfographicContainer(models.Model):
     container = models.ForeignKey(
@@ -277,13 +360,142 @@ class InfographicItem(models.Model):
     )
 
     def belongs(self):
-        if not self.infographicitem_item.exists():
+        # .all() instead of .exists() uses the admin's prefetched memberships
+        memberships = [membership
+                       for membership in self.infographicitem_item.all()
+                       if membership.infographic_id]
+        if not memberships:
             return _(u"No infographic")
 
-        return ", ".join(item.infographic.title for item in self.infographicitem_item.all())
+        return ", ".join(membership.infographic.title
+                         for membership in memberships)
 
     __unicode__ = lambda self: self.title
 
     class Meta:
         verbose_name = _(u'Infographic Item')
         verbose_name_plural = _(u'Infographic Items')
+
+
+class InfographicSnapshot(models.Model):
+    """
+    Serialized copy of a live infographic, everything its detail page and
+    JSON output show, so serving them is one read by (site, slug). It is
+    rebuilt as a whole when anything in it changes, see
+    opps.infographics.snapshot
+    """
+    infographic = models.OneToOneField(
+        'infographics.Infographic',
+        verbose_name=_(u'Infographic'),
+        related_name='snapshot'
+    )
+    site = models.ForeignKey('sites.Site')
+    # read with the document, see get_snapshot
+    channel = models.ForeignKey(
+        'channels.Channel',
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL
+    )
+    slug = models.SlugField(_(u"URL"), max_length=150)
+    document = JSONField()
+    date_update = models.DateTimeField(auto_now=True)
+
+    def __unicode__(self):
+        return self.slug
+
+    class Meta:
+        unique_together = ['site', 'slug']
+        verbose_name = _(u'Infographic snapshot')
+        verbose_name_plural = _(u'Infographic snapshots')
+
+
+class TimelineSnapshot(models.Model):
+    """
+    TimelineJS data of a timeline shown by infographics, serialized once when
+    the timeline or the infographic changes, see opps.infographics.timeline
+    """
+    timeline = models.OneToOneField(
+        'timelinejs.Timeline',
+        verbose_name=_(u'Timeline'),
+        related_name='infographic_snapshot'
+    )
+    data = models.TextField()
+    etag = models.CharField(max_length=32)
+    date_update = models.DateTimeField(auto_now=True)
+
+    def __unicode__(self):
+        return u'{0}'.format(self.timeline_id)
+
+    class Meta:
+        verbose_name = _(u'Timeline snapshot')
+        verbose_name_plural = _(u'Timeline snapshots')
+
+
+class SearchQueueEntry(models.Model):
+    """
+    An object whose search documents must be sent again, recorded on save
+    instead of calling the search backend, see opps.infographics.search_queue
+    """
+    model = models.CharField(max_length=100)
+    object_id = models.PositiveIntegerField()
+    date_insert = models.DateTimeField(auto_now_add=True)
+
+    def __unicode__(self):
+        return u'{0}.{1}'.format(self.model, self.object_id)
+
+    class Meta:
+        index_together = [['model', 'object_id']]
+        verbose_name = _(u'Search queue entry')
+        verbose_name_plural = _(u'Search queue entries')
+
+
+class InfographicBox(BaseBox):
+    infographics = models.ManyToManyField(
+        'infographics.Infographic',
+        null=True, blank=True,
+        related_name='infographicbox_infographics',
+        through='InfographicBoxInfographics'
+    )
+
+    def __unicode__(self):
+        return self.name
+
+    class Meta(BaseBox.Meta):
+        verbose_name = _(u'Infographic box')
+        verbose_name_plural = _(u'Infographic boxes')
+
+    def ordered_infographics(self):
+        """
+        Published infographics of the box in their box order, read from the
+        memberships prefetched by the box loader
+        """
+        return [membership.infographic for membership
+                in self.infographicboxinfographics_infographicboxes.all()
+                if membership.infographic.is_live]
+
+
+class InfographicBoxInfographics(models.Model):
+    infographicbox = models.ForeignKey(
+        'infographics.InfographicBox',
+        verbose_name=_(u'Infographic Box'),
+        related_name='infographicboxinfographics_infographicboxes'
+    )
+    infographic = models.ForeignKey(
+        'infographics.Infographic',
+        verbose_name=_(u'Infographic'),
+        related_name='infographicboxinfographics_infographics'
+    )
+    order = models.PositiveIntegerField(_(u'Order'), default=0)
+
+    def __unicode__(self):
+        return u"{0}-{1}".format(self.infographicbox.slug,
+                                 self.infographic.slug)
+
+    class Meta:
+        ordering = ('order',)
+        verbose_name = _(u'Infographic box infographic')
+        verbose_name_plural = _(u'Infographic box infographics')
+
+
+from . import signals  # noqa
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+import json
+from base64 import urlsafe_b64encode, urlsafe_b64decode
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+PAGINATE_BY = getattr(settings, 'OPPS_INFOGRAPHICS_PAGINATE_BY', 20)
+
+# (order, date_available, id) ordering of the lists, all in the same
+# direction so the listing indexes serve it without a sort
+ORDERING = ('order', 'date_available', 'id')
+REVERSE_ORDERING = ('-order', '-date_available', '-id')
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(obj, direction):
+    data = [direction, obj.order, obj.date_available.isoformat(), obj.pk]
+    return urlsafe_b64encode(json.dumps(data).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    try:
+        direction, order, date_available, pk = json.loads(
+            urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+        date_available = parse_datetime(date_available)
+        order, pk = int(order), int(pk)
+    except (TypeError, ValueError, UnicodeError):
+        raise InvalidCursor(cursor)
+    if direction not in ('next', 'prev') or date_available is None:
+        raise InvalidCursor(cursor)
+    return direction, order, date_available, pk
+
+
+def _after(order, date_available, pk):
+    return (Q(order__gt=order) |
+            Q(order=order, date_available__gt=date_available) |
+            Q(order=order, date_available=date_available, pk__gt=pk))
+
+
+def _before(order, date_available, pk):
+    return (Q(order__lt=order) |
+            Q(order=order, date_available__lt=date_available) |
+            Q(order=order, date_available=date_available, pk__lt=pk))
+
+
+class KeysetPage(object):
+    """
+    One page of a keyset paginated list, walked with the opaque next_cursor
+    and prev_cursor tokens. Filtering on the last row seen instead of using
+    OFFSET means a deep page costs the same as the first one, and no COUNT
+    is needed.
+    """
+
+    def __init__(self, object_list, has_next, has_previous):
+        self.object_list = object_list
+        self.has_next = has_next
+        self.has_previous = has_previous
+
+    @property
+    def next_cursor(self):
+        if self.has_next and self.object_list:
+            return encode_cursor(self.object_list[-1], 'next')
+
+    @property
+    def prev_cursor(self):
+        if self.has_previous and self.object_list:
+            return encode_cursor(self.object_list[0], 'prev')
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+def paginate(queryset, cursor=None, per_page=PAGINATE_BY):
+    """
+    Return the KeysetPage of queryset following cursor (the first page when
+    cursor is empty). Raises InvalidCursor for tokens not made by this module.
+    """
+    if not cursor:
+        object_list = list(queryset.order_by(*ORDERING)[:per_page + 1])
+        return KeysetPage(object_list[:per_page],
+                          has_next=len(object_list) > per_page,
+                          has_previous=False)
+
+    direction, order, date_available, pk = decode_cursor(cursor)
+    if direction == 'next':
+        object_list = list(queryset.filter(
+            _after(order, date_available, pk)
+        ).order_by(*ORDERING)[:per_page + 1])
+        return KeysetPage(object_list[:per_page],
+                          has_next=len(object_list) > per_page,
+                          has_previous=True)
+
+    object_list = list(queryset.filter(
+        _before(order, date_available, pk)
+    ).order_by(*REVERSE_ORDERING)[:per_page + 1])
+    has_previous = len(object_list) > per_page
+    object_list = object_list[:per_page]
+    object_list.reverse()
+    return KeysetPage(object_list, has_next=True, has_previous=has_previous)
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+from opps.images.generate import image_url
+
+from .albums import first_album_page
+
+
+# (width, height) of the renditions shown by the templates and the admin
+TOP_IMAGE_SIZES = ((960, None), (60, 60))
+IMAGE_SIZES = ((600, None), (60, 60))
+ALBUM_IMAGE_SIZES = ((600, None),)
+
+
+def size_key(width, height=None):
+    return u'{0}x{1}'.format(width, height or u'')
+
+
+def rendition(url, width, height=None):
+    if height:
+        return image_url(url, width=width, height=height)
+    return image_url(url, width=width)
+
+
+def build_renditions(infographic, items):
+    """
+    Return the {image url: {'<width>x<height>': rendition url}} map of every
+    image the pages of infographic show: top and main images, item images
+    and the first page of item albums
+    """
+    renditions = {}
+
+    def add(image, sizes):
+        if not image or not image.image:
+            return
+        url = image.image.url
+        entry = renditions.setdefault(url, {})
+        for width, height in sizes:
+            entry[size_key(width, height)] = rendition(url, width, height)
+
+    add(infographic.top_image, TOP_IMAGE_SIZES)
+    add(infographic.main_image, IMAGE_SIZES)
+    for item in items:
+        add(item.image, IMAGE_SIZES)
+        if item.album:
+            for image in first_album_page(item.album)[0]:
+                add(image, ALBUM_IMAGE_SIZES)
+    return renditions
+
+
+def rendition_urls(renditions):
+    return sorted(set(url for entry in (renditions or {}).values()
+                      for url in entry.values()))
+
+
+def lookup(renditions, url, width, height=None):
+    """
+    Rendition of url from the precomputed map, computed on the spot when
+    the map does not have it
+    """
+    try:
+        return renditions[url][size_key(width, height)]
+    except (KeyError, TypeError):
+        return rendition(url, width, height)
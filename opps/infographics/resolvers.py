@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+import time
+import threading
+
+from django.conf import settings
+from django.contrib.sites.models import Site, get_current_site
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from opps.channels.models import Channel
+
+
+# channels almost never change, they are kept per process for a while
+CHANNEL_CACHE_TIMEOUT = getattr(
+    settings, 'OPPS_INFOGRAPHICS_CHANNEL_CACHE_TIMEOUT', 60 * 5)
+
+# channels kept per process, the cache starts over when it is full
+CHANNEL_CACHE_SIZE = getattr(
+    settings, 'OPPS_INFOGRAPHICS_CHANNEL_CACHE_SIZE', 1000)
+
+_lock = threading.Lock()
+_channels = {}
+
+
+def clear_channel_cache():
+    with _lock:
+        _channels.clear()
+
+
+@receiver(post_save, sender=Channel)
+@receiver(post_delete, sender=Channel)
+def channel_changed(sender, **kwargs):
+    # other processes catch up when CHANNEL_CACHE_TIMEOUT expires
+    clear_channel_cache()
+
+
+def _cached_channel(key, lookup):
+    now = time.time()
+    entry = _channels.get(key)
+    if entry is not None and entry[0] > now:
+        return entry[1]
+
+    channel = lookup()
+    # misses are not kept, any slug can be requested
+    if channel is not None:
+        with _lock:
+            if len(_channels) >= CHANNEL_CACHE_SIZE:
+                _channels.clear()
+            _channels[key] = (now + CHANNEL_CACHE_TIMEOUT, channel)
+    return channel
+
+
+class RequestResolver(object):
+    """
+    Site and channel lookups shared by every view and template tag handling
+    one request, each resolved at most once.
+    """
+
+    def __init__(self, request=None):
+        self.request = request
+        self._site = None
+        self._channels = {}
+
+    @property
+    def site(self):
+        if self._site is None:
+            if self.request is None:
+                self._site = Site.objects.get_current()
+            else:
+                self._site = get_current_site(self.request)
+        return self._site
+
+    def _channel(self, key, lookup):
+        if key not in self._channels:
+            self._channels[key] = _cached_channel(key, lookup)
+        return self._channels[key]
+
+    @property
+    def homepage(self):
+        site = self.site
+        return self._channel(
+            ('homepage', site.id),
+            lambda: Channel.objects.get_homepage(site=site))
+
+    def channel(self, long_slug):
+        """
+        Return the channel with long_slug, or None
+        """
+        def lookup():
+            channels = list(Channel.objects.filter(long_slug=long_slug)[:1])
+            return channels[0] if channels else None
+        return self._channel(('channel', long_slug), lookup)
+
+
+def get_resolver(request):
+    if request is None:
+        return RequestResolver()
+
+    resolver = getattr(request, '_infographics_resolver', None)
+    if resolver is None:
+        resolver = RequestResolver(request)
+        request._infographics_resolver = resolver
+    return resolver
+
+
+def get_context_resolver(context):
+    """
+    Resolver of the request being rendered, when the template context has one
+    """
+    request = getattr(context, 'request', None) or context.get('request')
+    return get_resolver(request)
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Infographic
+from .renditions import rendition_urls
+from .surrogate import purge_batch
+from .warmup import warm_renditions
+
+
+def pending_live(now):
+    return Infographic.objects.filter(is_live=False, published=True,
+                                      date_available__lte=now)
+
+
+def pending_offline(now):
+    return Infographic.objects.filter(
+        Q(published=False) | Q(date_available__gt=now) |
+        Q(date_available__isnull=True),
+        is_live=True)
+
+
+def update_live(now=None):
+    """
+    Flip is_live on the infographics whose publication state changed since
+    the last run and return how many went live and offline. Each one is
+    saved, so the usual signals drop its cached pages, fragments and boxes,
+    and the CDN purges are sent together once the run ends. The renditions
+    of infographics going live are generated first, so their first
+    visitors do not wait on the image server.
+    """
+    now = now or timezone.now()
+    going_live = list(pending_live(now))
+    warm_renditions(url for infographic in going_live
+                    for url in rendition_urls(infographic.renditions))
+    counts = []
+    with purge_batch():
+        for queryset in (going_live, pending_offline(now)):
+            changed = 0
+            for infographic in queryset:
+                infographic.save(update_fields=['is_live', 'date_update'])
+                changed += 1
+            counts.append(changed)
+    return tuple(counts)
+
+
+def next_change(now=None):
+    """
+    date_available of the next infographic waiting to go live, or None
+    """
+    now = now or timezone.now()
+    dates = Infographic.objects.filter(
+        is_live=False, published=True, date_available__gt=now
+    ).order_by('date_available').values_list('date_available', flat=True)[:1]
+    return dates[0] if dates else None
@@ -1,16 +1,60 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
-from datetime import datetime
+import re
+import unicodedata
 
-from haystack.indexes import SearchIndex, Indexable, CharField, DateTimeField
+from django.utils.html import strip_tags
 
-from .models import Infographic
+from haystack.indexes import (SearchIndex, Indexable, CharField,
+                              DateTimeField, IntegerField, MultiValueField)
+
+from opps.utils.text import split_tags
+
+from .models import Infographic, InfographicInfographicItem
+
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def fold(token):
+    """
+    token without accents, what searching without them must match
+    """
+    return unicodedata.normalize('NFKD', token).encode(
+        'ascii', 'ignore').decode('ascii')
+
+
+def document(*texts):
+    """
+    Words of texts with html stripped, each one once, in the order they
+    first appear, followed by its unaccented form when it has accents
+    """
+    seen = set()
+    words = []
+    for text in texts:
+        for token in TOKEN_RE.findall(strip_tags(text or u'')):
+            key = token.lower()
+            if key in seen:
+                # its unaccented form was added along with it
+                continue
+            seen.add(key)
+            words.append(token)
+            folded = fold(token)
+            if folded and folded.lower() not in seen:
+                seen.add(folded.lower())
+                words.append(folded)
+    return u' '.join(words)
 
 
 class InfographicIndex(SearchIndex, Indexable):
-    text = CharField(document=True, use_template=True)
+    text = CharField(document=True)
     date_available = DateTimeField(model_attr='date_available')
     date_update = DateTimeField(model_attr='date_update')
+    # stored, so results can be filtered and faceted without the database
+    channel = CharField(faceted=True, null=True)
+    type = CharField(model_attr='type', faceted=True)
+    site = IntegerField(model_attr='site_id', faceted=True)
+    tags = MultiValueField(faceted=True)
 
     def get_updated_field(self):
         return 'date_update'
@@ -18,7 +62,65 @@ class InfographicIndex(SearchIndex, Indexable):
     def get_model(self):
         return Infographic
 
+    def index_queryset(self, using=None):
+        return self.get_model().objects.all_published().select_related(
+            'channel')
+
+    def load_chunk(self, pks, using=None):
+        """
+        Objects of one chunk of opps.infographics.indexing, in one query
+        """
+        return self.index_queryset(using=using).filter(pk__in=pks)
+
+    def prepare_text(self, obj):
+        return document(obj.title, obj.headline, obj.description,
+                        u' '.join(split_tags(obj.tags)))
+
+    def prepare_channel(self, obj):
+        if obj.channel_id:
+            return obj.channel.long_slug
+
+    def prepare_tags(self, obj):
+        return split_tags(obj.tags)
+
+
+class InfographicItemIndex(SearchIndex, Indexable):
+    """
+    One document per item of a live infographic, so results link straight
+    to the item page. Item and membership changes update the date_update of
+    their infographics, which is what incremental runs look at.
+    """
+    text = CharField(document=True)
+    title = CharField(model_attr='item__title')
+    url = CharField(indexed=False)
+    infographic = CharField(model_attr='infographic__slug')
+    date_available = DateTimeField(model_attr='infographic__date_available')
+    date_update = DateTimeField(model_attr='infographic__date_update')
+    channel = CharField(faceted=True, null=True)
+    type = CharField(model_attr='infographic__type', faceted=True)
+    site = IntegerField(model_attr='infographic__site_id', faceted=True)
+
+    def get_updated_field(self):
+        return 'infographic__date_update'
+
+    def get_model(self):
+        return InfographicInfographicItem
+
     def index_queryset(self, using=None):
         return self.get_model().objects.filter(
-            date_available__lte=datetime.now(),
-            published=True)
+            infographic__is_live=True).select_related(
+                'item', 'infographic__channel')
+
+    def load_chunk(self, pks, using=None):
+        return self.index_queryset(using=using).filter(pk__in=pks)
+
+    def prepare_text(self, obj):
+        return document(obj.item.title, obj.item.group, obj.item.description,
+                        obj.infographic.title)
+
+    def prepare_url(self, obj):
+        return obj.get_absolute_url()
+
+    def prepare_channel(self, obj):
+        if obj.infographic.channel_id:
+            return obj.infographic.channel.long_slug
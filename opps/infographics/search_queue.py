@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+from django.db.models import get_model
+from django.db.models.signals import post_save, post_delete
+
+from haystack import connections as haystack_connections
+from haystack.constants import DEFAULT_ALIAS
+from haystack.signals import BaseSignalProcessor
+
+from .indexing import model_label, update_index
+from .models import (Infographic, InfographicItem,
+                     InfographicInfographicItem, SearchQueueEntry)
+from .signals import remove_deleted_document, REMOVE_DOCUMENT_UID
+
+
+# queue entries sent to the backend per flush
+BATCH_SIZE = 500
+
+# models whose deleted documents go through the queue
+QUEUED_DELETES = (Infographic, InfographicInfographicItem)
+
+
+def enqueue(model, pks):
+    """
+    Record pks of model as dirty, an object already waiting in the queue
+    keeps a single entry
+    """
+    pks = set(pks)
+    if not pks:
+        return
+    label = model_label(model)
+    SearchQueueEntry.objects.filter(model=label, object_id__in=pks).delete()
+    SearchQueueEntry.objects.bulk_create([
+        SearchQueueEntry(model=label, object_id=pk) for pk in pks])
+
+
+def _memberships(**filters):
+    return InfographicInfographicItem.objects.filter(
+        **filters).values_list('pk', flat=True)
+
+
+class QueuedSignalProcessor(BaseSignalProcessor):
+    """
+    Haystack signal processor (HAYSTACK_SIGNAL_PROCESSOR) that only records
+    the infographics and items to index again, so saves never wait on the
+    search backend. The process_infographics_search_queue command sends
+    them in batches. The other models are indexed as usual.
+    """
+
+    def setup(self):
+        post_save.connect(self.handle_save)
+        post_delete.connect(self.handle_delete)
+        # deleted documents are queued too, instead of removed right away
+        for model in QUEUED_DELETES:
+            post_delete.disconnect(remove_deleted_document, sender=model,
+                                   dispatch_uid=REMOVE_DOCUMENT_UID)
+
+    def teardown(self):
+        post_save.disconnect(self.handle_save)
+        post_delete.disconnect(self.handle_delete)
+        for model in QUEUED_DELETES:
+            post_delete.connect(remove_deleted_document, sender=model,
+                                dispatch_uid=REMOVE_DOCUMENT_UID)
+
+    def handle_save(self, sender, instance, **kwargs):
+        # item documents carry the state and the slug of their infographic
+        if sender is Infographic:
+            enqueue(Infographic, [instance.pk])
+            enqueue(InfographicInfographicItem,
+                    _memberships(infographic=instance))
+        elif sender is InfographicItem:
+            enqueue(InfographicInfographicItem, _memberships(item=instance))
+        elif sender is InfographicInfographicItem:
+            enqueue(InfographicInfographicItem, [instance.pk])
+        else:
+            super(QueuedSignalProcessor, self).handle_save(
+                sender, instance, **kwargs)
+
+    def handle_delete(self, sender, instance, **kwargs):
+        # deleting an infographic or an item deletes its memberships too,
+        # each one sends post_delete
+        if sender in QUEUED_DELETES:
+            enqueue(sender, [instance.pk])
+        elif sender is not InfographicItem:
+            super(QueuedSignalProcessor, self).handle_delete(
+                sender, instance, **kwargs)
+
+
+def flush(batch_size=BATCH_SIZE, using=DEFAULT_ALIAS):
+    """
+    Send the oldest batch_size entries of the queue to the backend and
+    return how many documents were (updated, removed). Entries are only
+    dropped once sent, and entries recorded meanwhile are kept.
+    """
+    entries = list(SearchQueueEntry.objects.order_by('pk').values_list(
+        'pk', 'model', 'object_id')[:batch_size])
+    if not entries:
+        return 0, 0
+
+    dirty = {}
+    for entry_pk, label, object_id in entries:
+        dirty.setdefault(label, set()).add(object_id)
+
+    unified_index = haystack_connections[using].get_unified_index()
+    updated = removed = 0
+    for label, pks in dirty.items():
+        index = unified_index.get_index(get_model(*label.split('.')))
+        indexable = set(index.load_chunk(pks, using=using).values_list(
+            'pk', flat=True))
+        stale = pks - indexable
+        updated += update_index(index, sorted(indexable), sorted(stale),
+                                chunk_size=batch_size, using=using)
+        removed += len(stale)
+
+    SearchQueueEntry.objects.filter(
+        pk__in=[entry[0] for entry in entries]).delete()
+    return updated, removed
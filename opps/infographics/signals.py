@@ -0,0 +1,373 @@
+# -*- coding: utf-8 -*-
+import threading
+
+from django.core.signals import request_started, request_finished
+from django.db.models.signals import (pre_save, post_save, pre_delete,
+                                      post_delete, class_prepared)
+from django.db.models.query import prefetch_related_objects
+from django.dispatch import receiver
+from django.utils import timezone
+
+from opps.channels.models import Channel
+from opps.containers.models import Container, ContainerImage
+from opps.images.models import Image
+from opps.timelinejs.models import Timeline, TimelineContainer
+
+from .models import (Infographic, InfographicItem,
+                     InfographicInfographicItem, InfographicContainer,
+                     InfographicBox, InfographicBoxInfographics)
+from .cache import (invalidate_infographic, invalidate_fragments,
+                    invalidate_box)
+from .css import build_bundle
+from .menu import menu_items, build_menu
+from .renditions import build_renditions
+from .snapshot import update_snapshots, SNAPSHOT_PREFETCH
+from .timeline import update_timeline_snapshots
+from .surrogate import (purge, purge_batch, infographic_key, item_key,
+                        image_key, channel_key, list_key)
+
+
+def _item_pages(item):
+    return set(Infographic.objects.filter(
+        infographicitem_infographic__item=item
+    ).values_list('id', 'site_id', 'slug'))
+
+
+def _rebuild(infographics):
+    """
+    Rebuild the css bundle, the menu, the rendition map and the snapshot of
+    infographics, from a single prefetch of their images and items
+    """
+    infographics = list(infographics)
+    prefetch_related_objects(infographics, SNAPSHOT_PREFETCH)
+    for infographic in infographics:
+        items = menu_items(infographic)
+        changes = {}
+        css_hash = build_bundle(infographic, items)
+        if css_hash != infographic.css_hash:
+            changes['css_hash'] = css_hash
+        menu = build_menu(items)
+        if menu != infographic.menu:
+            changes['menu'] = menu
+        renditions = build_renditions(infographic, items)
+        if renditions != infographic.renditions:
+            changes['renditions'] = renditions
+        if changes:
+            for field, value in changes.items():
+                setattr(infographic, field, value)
+            # update() does not send post_save again
+            Infographic.objects.filter(pk=infographic.pk).update(**changes)
+    update_snapshots(infographics)
+
+
+def _invalidate(pages, touch=False):
+    """
+    pages is a set of (id, site_id, slug). With touch, infographics also get
+    a new date_update, their items changed and date_update is what
+    conditional requests and incremental exports rely on
+    """
+    for pk, site_id, slug in pages:
+        invalidate_infographic(site_id, slug)
+        purge(infographic_key(pk), list_key(site_id))
+    # infographics being deleted only lose their memberships first
+    pks = [pk for pk, site_id, slug in pages if pk not in _deleting()]
+    if touch and pks:
+        Infographic.objects.filter(pk__in=pks).update(
+            date_update=timezone.now())
+        _rebuild_later(pks)
+
+
+_local = threading.local()
+
+
+def _deleting():
+    if not hasattr(_local, 'deleting'):
+        _local.deleting = set()
+    return _local.deleting
+
+
+def _pending_rebuilds():
+    if not hasattr(_local, 'rebuilds'):
+        _local.rebuilds = set()
+    return _local.rebuilds
+
+
+def _rebuild_later(pks):
+    """
+    Within a request, rebuild infographics pks once it ends, so an admin
+    save of an infographic and its inline items rebuilds it once. Anywhere
+    else (management commands, workers) they are rebuilt right away.
+    """
+    if getattr(_local, 'in_request', False):
+        _pending_rebuilds().update(pks)
+    else:
+        _rebuild(Infographic.objects.filter(pk__in=pks))
+
+
+def flush_rebuilds(**kwargs):
+    pending = _pending_rebuilds()
+    if not pending:
+        return
+    infographics = list(Infographic.objects.filter(pk__in=pending))
+    pending.clear()
+    _rebuild(infographics)
+    # pages regenerated before the rebuild show the old snapshot
+    with purge_batch():
+        for infographic in infographics:
+            invalidate_infographic(infographic.site_id, infographic.slug)
+            purge(infographic_key(infographic.pk),
+                  list_key(infographic.site_id))
+
+
+@receiver(request_started, dispatch_uid='opps_infographics_start_rebuilds')
+def _request_started(**kwargs):
+    _local.in_request = True
+
+
+@receiver(request_finished, dispatch_uid='opps_infographics_flush_rebuilds')
+def _request_finished(**kwargs):
+    _local.in_request = False
+    flush_rebuilds()
+
+
+@receiver(pre_delete, sender=Infographic)
+def infographic_pre_delete(sender, instance, **kwargs):
+    _deleting().add(instance.pk)
+
+
+@receiver(pre_save, sender=Infographic)
+def infographic_pre_save(sender, instance, **kwargs):
+    # a renamed or moved infographic must also drop the pages under its old
+    # slug and the fragments of its old channel
+    instance._infographics_pages = set()
+    instance._infographics_channels = set()
+    if instance.pk:
+        for pk, site_id, slug, channel_slug in Infographic.objects.filter(
+                pk=instance.pk).values_list('id', 'site_id', 'slug',
+                                            'channel__slug'):
+            instance._infographics_pages.add((pk, site_id, slug))
+            instance._infographics_channels.add((site_id, channel_slug))
+
+
+@receiver(post_save, sender=Infographic)
+@receiver(post_delete, sender=Infographic)
+def infographic_changed(sender, instance, **kwargs):
+    if kwargs['signal'] is post_save:
+        _rebuild([instance])
+        update_timeline_snapshots([instance.timeline_id])
+    else:
+        _deleting().discard(instance.pk)
+    pages = getattr(instance, '_infographics_pages', set())
+    _invalidate(pages | set([(instance.pk, instance.site_id, instance.slug)]))
+
+    channels = getattr(instance, '_infographics_channels', set())
+    channels.add((instance.site_id, None))
+    if instance.channel_id:
+        channels.add((instance.site_id, instance.channel.slug))
+    for site_id, channel_slug in channels:
+        invalidate_fragments(site_id, channel_slug)
+
+    _invalidate_boxes(InfographicBox.objects.filter(
+        infographicboxinfographics_infographicboxes__infographic=instance
+    ).values_list('site_id', 'slug'))
+
+
+@receiver(pre_delete, sender=InfographicItem)
+def item_pre_delete(sender, instance, **kwargs):
+    # memberships are deleted before post_delete is sent
+    instance._infographics_pages = _item_pages(instance)
+
+
+@receiver(post_save, sender=InfographicItem)
+@receiver(post_delete, sender=InfographicItem)
+def item_changed(sender, instance, **kwargs):
+    pages = getattr(instance, '_infographics_pages', None)
+    if pages is None:
+        pages = _item_pages(instance)
+    _invalidate(pages, touch=True)
+    purge(item_key(instance.pk))
+    if kwargs['signal'] is post_save:
+        update_timeline_snapshots([instance.timeline_id])
+
+
+@receiver(post_save, sender=InfographicInfographicItem)
+@receiver(post_delete, sender=InfographicInfographicItem)
+@receiver(post_save, sender=InfographicContainer)
+@receiver(post_delete, sender=InfographicContainer)
+def membership_changed(sender, instance, **kwargs):
+    _invalidate(set(Infographic.objects.filter(
+        pk=instance.infographic_id).values_list('id', 'site_id', 'slug')),
+        touch=True)
+
+
+# deleting an infographic or an item deletes its memberships too, each one
+# sends post_delete. QueuedSignalProcessor queues them instead.
+REMOVE_DOCUMENT_UID = 'opps_infographics_remove_document'
+
+
+@receiver(post_delete, sender=Infographic, dispatch_uid=REMOVE_DOCUMENT_UID)
+@receiver(post_delete, sender=InfographicInfographicItem,
+          dispatch_uid=REMOVE_DOCUMENT_UID)
+def remove_deleted_document(sender, instance, **kwargs):
+    # index_infographics only sees the rows that still exist. Imported here,
+    # haystack imports this app for its signal processor.
+    from .indexing import remove_documents
+    remove_documents(sender, [instance.pk])
+
+
+def _invalidate_boxes(boxes):
+    for site_id, slug in set(boxes):
+        invalidate_box(site_id, slug)
+
+
+@receiver(pre_save, sender=InfographicBox)
+def box_pre_save(sender, instance, **kwargs):
+    instance._infographics_boxes = set()
+    if instance.pk:
+        instance._infographics_boxes.update(InfographicBox.objects.filter(
+            pk=instance.pk).values_list('site_id', 'slug'))
+
+
+@receiver(post_save, sender=InfographicBox)
+@receiver(post_delete, sender=InfographicBox)
+def box_changed(sender, instance, **kwargs):
+    boxes = getattr(instance, '_infographics_boxes', set())
+    _invalidate_boxes(boxes | set([(instance.site_id, instance.slug)]))
+
+
+@receiver(post_save, sender=InfographicBoxInfographics)
+@receiver(post_delete, sender=InfographicBoxInfographics)
+def box_membership_changed(sender, instance, **kwargs):
+    _invalidate_boxes(InfographicBox.objects.filter(
+        pk=instance.infographicbox_id).values_list('site_id', 'slug'))
+
+
+def _image_infographics(image):
+    # one indexed query per way infographics show an image, an OR of them
+    # all joins every table for each image saved anywhere in the CMS
+    pks = set()
+    for lookup in ('top_image', 'main_image'):
+        pks.update(Infographic.objects.filter(**{lookup: image}).values_list(
+            'id', flat=True))
+    memberships = InfographicInfographicItem.objects.values_list(
+        'infographic_id', flat=True)
+    pks.update(memberships.filter(item__image=image))
+    albums = list(ContainerImage.objects.filter(image=image).values_list(
+        'container_id', flat=True))
+    if albums:
+        pks.update(memberships.filter(item__album__in=albums))
+    return pks
+
+
+@receiver(pre_delete, sender=Image)
+def image_pre_delete(sender, instance, **kwargs):
+    # infographics and albums lose the image before post_delete is sent
+    instance._infographics_pks = _image_infographics(instance)
+
+
+@receiver(post_save, sender=Image)
+@receiver(post_delete, sender=Image)
+def image_changed(sender, instance, **kwargs):
+    purge(image_key(instance.pk))
+    pks = getattr(instance, '_infographics_pks', None)
+    if pks is None:
+        pks = _image_infographics(instance)
+    # the rendition map is keyed by image url, rebuild it with the snapshot
+    _rebuild_later(pks)
+
+
+@receiver(post_save, sender=ContainerImage)
+@receiver(post_delete, sender=ContainerImage)
+def album_image_changed(sender, instance, **kwargs):
+    # the first page of item albums is part of snapshots and rendition maps
+    _invalidate(set(Infographic.objects.filter(
+        infographicitem_infographic__item__album=instance.container_id
+    ).values_list('id', 'site_id', 'slug')), touch=True)
+
+
+@receiver(pre_delete, sender=Channel)
+def channel_pre_delete(sender, instance, **kwargs):
+    # infographics lose their channel before post_delete is sent
+    instance._infographics_pages = set(Infographic.objects.filter(
+        channel=instance).values_list('id', 'site_id', 'slug'))
+
+
+@receiver(post_save, sender=Channel)
+@receiver(post_delete, sender=Channel)
+def channel_changed(sender, instance, **kwargs):
+    # snapshots read their channel along with the document, only the cached
+    # pages of a deleted channel still show it
+    purge(channel_key(instance.pk))
+    _invalidate(getattr(instance, '_infographics_pages', set()))
+
+
+def _timeline_pages(timeline):
+    pks = set(Infographic.objects.filter(timeline=timeline).values_list(
+        'id', flat=True))
+    pks.update(InfographicInfographicItem.objects.filter(
+        item__timeline=timeline).values_list('infographic_id', flat=True))
+    return set(Infographic.objects.filter(pk__in=pks).values_list(
+        'id', 'site_id', 'slug'))
+
+
+@receiver(pre_delete, sender=Timeline)
+def timeline_pre_delete(sender, instance, **kwargs):
+    # infographics and items lose the timeline before post_delete is sent
+    instance._infographics_pages = _timeline_pages(instance)
+
+
+@receiver(post_save, sender=Timeline)
+@receiver(post_delete, sender=Timeline)
+def timeline_changed(sender, instance, **kwargs):
+    update_timeline_snapshots([instance.pk])
+    pages = getattr(instance, '_infographics_pages', None)
+    if pages is None:
+        pages = _timeline_pages(instance)
+    # the embeds on their pages read the source of the timeline
+    _invalidate(pages, touch=True)
+
+
+@receiver(post_save, sender=TimelineContainer)
+@receiver(post_delete, sender=TimelineContainer)
+def timeline_membership_changed(sender, instance, **kwargs):
+    update_timeline_snapshots([instance.timeline_id])
+
+
+def _container_timelines(container):
+    return set(TimelineContainer.objects.filter(
+        container=container).values_list('timeline_id', flat=True))
+
+
+def container_pre_delete(sender, instance, **kwargs):
+    # memberships lose their container before post_delete is sent
+    instance._infographics_timelines = _container_timelines(instance)
+
+
+def container_changed(sender, instance, **kwargs):
+    timelines = getattr(instance, '_infographics_timelines', None)
+    if timelines is None:
+        timelines = _container_timelines(instance)
+    update_timeline_snapshots(timelines)
+
+
+def _connect_container(model):
+    """
+    Containers are the events of timelines, and signals are sent with the
+    subclass they are saved as, so connect Container and each subclass
+    """
+    pre_delete.connect(container_pre_delete, sender=model,
+                       dispatch_uid='opps_infographics_container_pre_delete')
+    for signal in (post_save, post_delete):
+        signal.connect(container_changed, sender=model,
+                       dispatch_uid='opps_infographics_container_changed')
+    for subclass in model.__subclasses__():
+        _connect_container(subclass)
+
+
+@receiver(class_prepared)
+def container_prepared(sender, **kwargs):
+    if issubclass(sender, Container):
+        _connect_container(sender)
+
+
+_connect_container(Container)
@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+from django.db.models.query import prefetch_related_objects
+from django.utils.dateparse import parse_datetime
+
+from .albums import first_album_page
+from .menu import MENU_PREFETCH, menu_items
+from .models import InfographicSnapshot
+from .surrogate import infographic_keys, item_key, image_key
+
+
+SNAPSHOT_PREFETCH = [
+    'channel', 'top_image', 'main_image', 'timeline',
+    MENU_PREFETCH,
+    MENU_PREFETCH + '__image',
+    MENU_PREFETCH + '__album',
+    MENU_PREFETCH + '__timeline',
+]
+
+
+class Document(object):
+    """
+    Read only attribute access to a snapshot document, so views and
+    templates written for the models work on it unchanged. Nested dicts
+    and lists are wrapped as well, date_* values are parsed back.
+    """
+
+    def __init__(self, data):
+        self._data = data
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        try:
+            value = self._data[name]
+        except KeyError:
+            raise AttributeError(name)
+        if name.startswith('date_') and value:
+            return parse_datetime(value)
+        return wrap(value)
+
+    def __nonzero__(self):
+        return True
+
+    def get_absolute_url(self):
+        return self._data.get('url')
+
+    def raw(self, name, default=None):
+        """
+        Value of name as stored, without wrapping
+        """
+        return self._data.get(name, default)
+
+
+class DocumentList(list):
+
+    def all(self):
+        return self
+
+
+def wrap(value):
+    if isinstance(value, dict):
+        return Document(value)
+    if isinstance(value, list):
+        return DocumentList(wrap(v) for v in value)
+    return value
+
+
+def _image(image):
+    if not image or not image.image:
+        return None
+    return {'id': image.pk,
+            'pk': image.pk,
+            'title': image.title,
+            'image': {'url': image.image.url}}
+
+
+def _album(album):
+    if not album:
+        return None
+    images, has_more, next_offset = first_album_page(album)
+    return {'id': album.pk,
+            'pk': album.pk,
+            'slug': album.slug,
+            'title': album.title,
+            'images': [_image(image) for image in images if image.image],
+            'has_more': has_more,
+            'next_offset': next_offset}
+
+
+def _channel(channel):
+    if channel:
+        return {'id': channel.pk,
+                'pk': channel.pk,
+                'name': channel.name,
+                'slug': channel.slug,
+                'long_slug': channel.long_slug,
+                'date_update': channel.date_update}
+
+
+def _timeline(timeline):
+    if timeline:
+        return {'id': timeline.pk,
+                'pk': timeline.pk,
+                'source': timeline.source or u''}
+
+
+def _item(item):
+    return {'id': item.pk,
+            'pk': item.pk,
+            'title': item.title,
+            'slug': item.slug,
+            'description': item.description,
+            'group': item.group,
+            'order': item.order,
+            'css_text': item.css_text,
+            'image': _image(item.image),
+            'album': _album(item.album),
+            'timeline': _timeline(item.timeline)}
+
+
+def build_document(infographic):
+    """
+    Everything the detail page and the JSON output of infographic show,
+    from the objects prefetched with SNAPSHOT_PREFETCH
+    """
+    from .api import serialize_infographic
+
+    items = menu_items(infographic)
+    return {
+        'infographic': {
+            'id': infographic.pk,
+            'pk': infographic.pk,
+            'site_id': infographic.site_id,
+            'title': infographic.title,
+            'slug': infographic.slug,
+            'headline': infographic.headline,
+            'description': infographic.description,
+            'type': infographic.type,
+            'tags': infographic.tags,
+            'channel': _channel(infographic.channel),
+            'top_image': _image(infographic.top_image),
+            'main_image': _image(infographic.main_image),
+            'timeline': _timeline(infographic.timeline),
+            'menu': infographic.menu,
+            'renditions': infographic.renditions,
+            'items': [_item(item) for item in items],
+            'css_url': infographic.css_url,
+            'css_path': infographic.css_path,
+            'js_path': infographic.js_path,
+            'date_available': infographic.date_available.isoformat(),
+            'date_update': infographic.date_update.isoformat(),
+            'url': infographic.get_absolute_url(),
+        },
+        'api': serialize_infographic(infographic, items),
+        'keys': (infographic_keys(infographic, items=False) +
+                 _item_keys(items)),
+    }
+
+
+def _item_keys(items):
+    keys = []
+    for item in items:
+        keys.append(item_key(item.pk))
+        if item.image_id:
+            keys.append(image_key(item.image_id))
+    return keys
+
+
+def update_snapshots(infographics):
+    """
+    Rebuild the snapshots of the live infographics and drop the others'
+    """
+    infographics = list(infographics)
+    InfographicSnapshot.objects.filter(infographic__in=[
+        infographic.pk for infographic in infographics
+        if not infographic.is_live]).delete()
+
+    live = [infographic for infographic in infographics
+            if infographic.is_live]
+    prefetch_related_objects(live, SNAPSHOT_PREFETCH)
+    for infographic in live:
+        fields = {'site': infographic.site_id,
+                  'channel': infographic.channel_id,
+                  'slug': infographic.slug,
+                  'document': build_document(infographic)}
+        if not InfographicSnapshot.objects.filter(
+                infographic=infographic).update(**fields):
+            fields['site_id'] = fields.pop('site')
+            fields['channel_id'] = fields.pop('channel')
+            InfographicSnapshot.objects.create(infographic=infographic,
+                                               **fields)
+
+
+def get_snapshot(site, slug):
+    """
+    Document of the live infographic slug, one indexed read, or None. The
+    channel is read along with it, so channel edits never rebuild
+    snapshots.
+    """
+    snapshots = list(InfographicSnapshot.objects.filter(
+        site=site, slug=slug).select_related('channel')[:1])
+    if snapshots:
+        document = snapshots[0].document
+        channel = snapshots[0].channel
+        document['infographic']['channel'] = _channel(channel)
+        document['api']['channel'] = channel.long_slug if channel else None
+        return document
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+import logging
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.signals import request_started, request_finished
+from django.utils.importlib import import_module
+
+
+PURGE_BACKEND = getattr(settings, 'OPPS_INFOGRAPHICS_PURGE_BACKEND',
+                        'opps.infographics.surrogate.LoggingPurgeBackend')
+PURGE_BATCH_SIZE = getattr(settings, 'OPPS_INFOGRAPHICS_PURGE_BATCH_SIZE',
+                           100)
+SURROGATE_KEY_HEADER = getattr(settings,
+                               'OPPS_INFOGRAPHICS_SURROGATE_KEY_HEADER',
+                               'Surrogate-Key')
+
+logger = logging.getLogger(__name__)
+
+
+def infographic_key(pk):
+    return u'infographic-{0}'.format(pk)
+
+
+def item_key(pk):
+    return u'infographicitem-{0}'.format(pk)
+
+
+def image_key(pk):
+    return u'image-{0}'.format(pk)
+
+
+def channel_key(pk):
+    return u'channel-{0}'.format(pk)
+
+
+def site_key(pk):
+    return u'site-{0}'.format(pk)
+
+
+def list_key(site_id):
+    return u'infographic-list-{0}'.format(site_id)
+
+
+def infographic_keys(infographic, items=True):
+    """
+    Keys of everything a page showing infographic depends on
+    """
+    keys = [infographic_key(infographic.pk), site_key(infographic.site_id)]
+    if infographic.channel_id:
+        keys.append(channel_key(infographic.channel_id))
+    for image_id in (infographic.top_image_id, infographic.main_image_id):
+        if image_id:
+            keys.append(image_key(image_id))
+    if items:
+        for item in infographic.items.all():
+            keys.append(item_key(item.pk))
+            if item.image_id:
+                keys.append(image_key(item.image_id))
+    return keys
+
+
+class LoggingPurgeBackend(object):
+    """
+    Only logs the keys, CDN backends subclass it and override purge
+    """
+
+    def purge(self, keys):
+        """
+        Purge every cached response tagged with one of keys
+        """
+        logger.info(u'Purging surrogate keys: %s', u' '.join(sorted(keys)))
+
+
+_backend = {}
+
+
+def get_purge_backend():
+    if PURGE_BACKEND not in _backend:
+        module, name = PURGE_BACKEND.rsplit('.', 1)
+        _backend[PURGE_BACKEND] = getattr(import_module(module), name)()
+    return _backend[PURGE_BACKEND]
+
+
+_pending = threading.local()
+
+
+def _pending_keys():
+    if not hasattr(_pending, 'keys'):
+        _pending.keys = set()
+    return _pending.keys
+
+
+def _batching():
+    return (getattr(_pending, 'in_request', False) or
+            getattr(_pending, 'batches', 0) > 0)
+
+
+def purge(*keys):
+    """
+    Queue keys to be purged. Within a request or a purge_batch they are
+    sent in batches when it ends or PURGE_BATCH_SIZE keys are pending,
+    anywhere else (management commands, workers) right away.
+    """
+    pending = _pending_keys()
+    pending.update(keys)
+    if len(pending) >= PURGE_BATCH_SIZE or not _batching():
+        flush_purges()
+
+
+def flush_purges(**kwargs):
+    pending = _pending_keys()
+    if not pending:
+        return
+    keys = list(pending)
+    pending.clear()
+    for i in range(0, len(keys), PURGE_BATCH_SIZE):
+        get_purge_backend().purge(keys[i:i + PURGE_BATCH_SIZE])
+
+
+@contextmanager
+def purge_batch():
+    """
+    Send the keys purged inside the block together, once it ends
+    """
+    _pending.batches = getattr(_pending, 'batches', 0) + 1
+    try:
+        yield
+    finally:
+        _pending.batches -= 1
+        if not _batching():
+            flush_purges()
+
+
+def _request_started(**kwargs):
+    _pending.in_request = True
+
+
+def _request_finished(**kwargs):
+    _pending.in_request = False
+    if not _batching():
+        flush_purges()
+
+
+request_started.connect(_request_started,
+                        dispatch_uid='opps_infographics_start_purges')
+request_finished.connect(_request_finished,
+                         dispatch_uid='opps_infographics_flush_purges')
+
+
+class SurrogateKeyMixin(object):
+    """
+    Tag responses with the surrogate keys of what they show, so the CDN can
+    keep them until a purge
+    """
+
+    def get_surrogate_keys(self):
+        return []
+
+    def dispatch(self, request, *args, **kwargs):
+        response = super(SurrogateKeyMixin, self).dispatch(
+            request, *args, **kwargs)
+        if response.status_code == 200:
+            keys = self.get_surrogate_keys()
+            if keys:
+                response[SURROGATE_KEY_HEADER] = u' '.join(
+                    sorted(set(keys)))
+        return response
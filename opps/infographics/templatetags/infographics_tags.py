@@ -1,68 +1,129 @@
 # -*- coding: utf-8 -*-
 
 from django import template
-from django.utils import timezone
-from django.contrib.sites.models import get_current_site
-from opps.infographics.models import Infographic, InfographicBox
+from django.conf import settings
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
+from opps.infographics.models import Infographic, app_namespace
+from opps.infographics.resolvers import get_context_resolver
+from opps.infographics.cache import fragment_cache_key
+from opps.infographics.loading import get_compiled_template
+from opps.infographics.albums import album_page
+from opps.infographics.renditions import lookup
+from opps.infographics.snapshot import Document
+from opps.infographics.boxes import (published_boxes, render_boxes,
+                                     box_placeholder, defer_boxes)
 
 register = template.Library()
 
+FRAGMENT_CACHE_TIMEOUT = getattr(
+    settings, 'OPPS_INFOGRAPHICS_FRAGMENT_CACHE_TIMEOUT', 60 * 5)
+TIMELINEJS_EMBED_URL = getattr(
+    settings, 'OPPS_INFOGRAPHICS_TIMELINEJS_EMBED_URL',
+    '//cdn.knightlab.com/libs/timeline/latest/js/storyjs-embed.js')
+
 
 @register.simple_tag(takes_context=True)
 def get_all_infographics(context, number=5,
                          channel_slug=None,
                          template_name='infographics/actives.html'):
-
-    active_infographics = Infographic.objects.all_published()
+    """
+    The rendered fragment is cached per site, channel, number and template,
+    until an infographic of that channel changes. It is shared by every
+    page, so it only sees the infographics and the channel, never the
+    context of the page that renders it first.
+    """
+    site = get_context_resolver(context).site
+    key = fragment_cache_key(site.id, channel_slug, number, template_name)
+    rendered = cache.get(key)
+    if rendered is not None:
+        return rendered
+
+    active_infographics = Infographic.objects.all_published().filter(
+        site=site)
     if channel_slug:
         active_infographics = active_infographics.filter(channel__slug=channel_slug)
 
     active_infographics = active_infographics[:number]
 
-    t = template.loader.get_template(template_name)
+    t = get_compiled_template(template_name)
 
-    return t.render(template.Context({'active_infographics': active_infographics,
-                                      'channel_slug': channel_slug,
-                                      'number': number,
-                                      'context': context}))
+    rendered = t.render(template.Context({'active_infographics': active_infographics,
+                                          'channel_slug': channel_slug}))
+    cache.set(key, rendered, FRAGMENT_CACHE_TIMEOUT)
+    return rendered
 
 
 @register.simple_tag(takes_context=True)
 def get_infographicbox(context, slug, channel_slug=None, template_name=None):
+    """
+    With InfographicBoxMiddleware only a placeholder is rendered here, and
+    all boxes of the page are loaded together at the end of the response
+    """
     if channel_slug:
         slug = u"{0}-{1}".format(slug, channel_slug)
 
-    site = get_current_site(context.request)
-
-    try:
-        box = InfographicBox.objects.get(
-            site=site,
-            slug=slug,
-            date_available__lte=timezone.now(),
-            published=True
-        )
-    except InfographicBox.DoesNotExist:
-        box = None
+    request = context.get('request')
+    if defer_boxes(request):
+        return box_placeholder(slug, template_name)
 
-    t = template.loader.get_template('infographics/infographicbox_detail.html')
-    if template_name:
-        t = template.loader.get_template(template_name)
-
-    return t.render(template.Context({'infographicbox': box,
-                                      'slug': slug,
-                                      'context': context}))
+    site = get_context_resolver(context).site
+    return render_boxes(site, [(slug, template_name)],
+                        context)[(slug, template_name)]
 
 
 @register.simple_tag(takes_context=True)
 def get_all_infographicbox(context, channel_slug, template_name=None):
-    site = get_current_site(context.request)
-    boxes = InfographicBox.objects.filter(site=site,
-                                          date_available__lte=timezone.now(),
-                                          published=True,
-                                          channel__slug=channel_slug)
+    site = get_context_resolver(context).site
+    boxes = published_boxes(site).filter(channel__slug=channel_slug)
 
-    t = template.loader.get_template('infographics/infographicbox_list.html')
-    if template_name:
-        t = template.loader.get_template(template_name)
+    t = get_compiled_template(
+        template_name or 'infographics/infographicbox_list.html')
 
     return t.render(template.Context({'infographicboxes': boxes, 'context': context}))
+
+
+@register.assignment_tag
+def get_album_page(album):
+    """
+    First page of album images for the gallery, read from the snapshot when
+    album comes from one, the next pages come from the api_item_album view
+    """
+    if not album:
+        return {'images': [], 'has_more': False, 'next_offset': 0}
+    if isinstance(album, Document):
+        return {'images': getattr(album, 'images', []),
+                'has_more': getattr(album, 'has_more', False),
+                'next_offset': getattr(album, 'next_offset', 0)}
+    images, has_more, next_offset = album_page(album.pk)
+    return {'images': images, 'has_more': has_more,
+            'next_offset': next_offset}
+
+
+@register.simple_tag
+def rendition_url(infographic, url, width, height=None):
+    """
+    Rendition of an image of infographic, from its precomputed map
+    """
+    if isinstance(infographic, Document):
+        renditions = infographic.raw('renditions')
+    else:
+        renditions = infographic.renditions
+    return lookup(renditions, url, int(width), height and int(height))
+
+
+@register.inclusion_tag('infographics/timeline_embed.html')
+def timeline_embed(timeline_id, width=960, height=600, source=None):
+    """
+    TimelineJS embed reading the serialized data of the timeline, instead
+    of serializing it on every page view. A timeline with a source (a
+    spreadsheet or a JSON document) is read from it as it is.
+    """
+    if not source:
+        source = reverse('{0}:api_timeline'.format(app_namespace),
+                         kwargs={'pk': timeline_id})
+    return {'timeline_id': timeline_id,
+            'width': width,
+            'height': height,
+            'source': source,
+            'embed_url': TIMELINEJS_EMBED_URL}
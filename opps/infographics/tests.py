@@ -1,11 +1,69 @@
+# -*- coding: utf-8 -*-
 """
 This file demonstrates writing tests using the unittest module. These will pass
 when you run "manage.py test".
 
 Replace this with more appropriate tests for your application.
 """
+import os
+import re
+import json
+import shutil
+import tempfile
+from StringIO import StringIO
+from contextlib import contextmanager
+from datetime import date, timedelta
 
+from mock import patch, Mock
+
+from django import template
 from django.test import TestCase
+from django.http import HttpResponse
+from django.utils import unittest
+from django.db import connection, IntegrityError
+from django.core.urlresolvers import reverse
+from django.contrib.admin import site as admin_site
+from django.contrib.auth import get_user_model
+from django.contrib.sites.models import Site
+from django.core.cache import cache
+from django.core.files.storage import FileSystemStorage
+from django.core.management import call_command
+from django.test.client import RequestFactory
+from django.utils import timezone
+from django.utils.html import escapejs
+
+from opps.channels.models import Channel
+from opps.images.models import Image
+from opps.articles.models import Album
+from opps.containers.models import ContainerImage
+from opps.timelinejs.models import Timeline, TimelineContainer
+
+from .models import (Infographic, InfographicItem, InfographicInfographicItem,
+                     InfographicBox, InfographicBoxInfographics,
+                     InfographicSnapshot, TimelineSnapshot,
+                     SearchQueueEntry)
+from .admin import InfographicAdmin
+from .boxes import InfographicBoxMiddleware
+from .scheduler import update_live, next_change
+from .albums import ALBUM_PAGE_SIZE
+from .snapshot import get_snapshot
+from . import resolvers, signals
+from .indexing import changed, update_index
+from .search_queue import QueuedSignalProcessor, flush
+from .search_indexes import (InfographicIndex, InfographicItemIndex,
+                             document)
+from .renditions import size_key
+from .warmup import NullWarmer
+from .cache import page_cache_key
+from .pagination import paginate, InvalidCursor, ORDERING
+from .thumbnails import thumb_url
+from .css import minify
+from .surrogate import (SURROGATE_KEY_HEADER, LoggingPurgeBackend,
+                        purge_batch, infographic_key, item_key, image_key,
+                        channel_key, flush_purges)
+from .resolvers import get_resolver, clear_channel_cache
+from .loading import (resolve_template_name, clear_template_cache,
+                      invalidate_template_cache)
 
 
 class SimpleTest(TestCase):
@@ -14,3 +72,1396 @@ class SimpleTest(TestCase):
         Tests that 1 + 1 always equals 2.
         """
         self.assertEqual(1 + 1, 2)
+
+
+class QueryCounter(object):
+    count = 0
+
+
+@contextmanager
+def count_queries():
+    counter = QueryCounter()
+    old_debug_cursor = connection.use_debug_cursor
+    connection.use_debug_cursor = True
+    start = len(connection.queries)
+    try:
+        yield counter
+    finally:
+        counter.count = len(connection.queries) - start
+        connection.use_debug_cursor = old_debug_cursor
+
+
+class InfographicTestCase(TestCase):
+
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create(username=u'infographics',
+                                        email=u'infographics@oppsproject.org')
+        self.site = Site.objects.get(pk=1)
+        self.channel = Channel.objects.create(
+            name=u'Home', slug=u'home', homepage=True, published=True,
+            site=self.site, user=self.user
+        )
+        self.image = Image.objects.create(
+            title=u'Image', slug=u'image', image=u'infographics/image.jpg',
+            published=True, site=self.site, user=self.user
+        )
+
+    def create_infographic(self, slug, type='gallery', items=0, **kwargs):
+        infographic = Infographic.objects.create(
+            title=slug, slug=slug, type=type, published=True,
+            site=self.site, user=self.user, channel=self.channel,
+            top_image=self.image, main_image=self.image, **kwargs
+        )
+        for i in range(items):
+            item = InfographicItem.objects.create(
+                title=u'Item {0}'.format(i),
+                slug=u'{0}-item-{1}'.format(slug, i),
+                image=self.image,
+                order=i
+            )
+            InfographicInfographicItem.objects.create(
+                infographic=infographic, item=item
+            )
+        return infographic
+
+
+class InfographicDetailQueryBudgetTest(InfographicTestCase):
+    """
+    The detail page must cost the same number of queries no matter how many
+    items the infographic has, bringing back N+1 lookups fails here.
+    """
+
+    # max queries allowed to render a detail page, per infographic type
+    budget = {'gallery': 8, 'timeline': 8, 'css': 8}
+
+    def get_query_count(self, url):
+        with count_queries() as counter:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return counter.count
+
+    def assertQueryBudget(self, type):
+        small = self.create_infographic(u'small-' + type, type=type, items=1)
+        large = self.create_infographic(u'large-' + type, type=type,
+                                        items=20)
+
+        for with_item in (False, True):
+            counts = []
+            for infographic in (small, large):
+                kwargs = {'slug': infographic.slug}
+                url_name = 'infographics:open_infographic'
+                if with_item:
+                    kwargs['item_slug'] = u'{0}-item-0'.format(
+                        infographic.slug)
+                    url_name = 'infographics:item_infographic'
+                counts.append(self.get_query_count(
+                    reverse(url_name, kwargs=kwargs)))
+
+            self.assertEqual(counts[0], counts[1])
+            self.assertTrue(counts[1] <= self.budget[type],
+                            u'{0} detail used {1} queries, budget is {2}'
+                            .format(type, counts[1], self.budget[type]))
+
+    def test_gallery_query_budget(self):
+        self.assertQueryBudget('gallery')
+
+    def test_timeline_query_budget(self):
+        self.assertQueryBudget('timeline')
+
+    def test_css_query_budget(self):
+        self.assertQueryBudget('css')
+
+    def test_unknown_item_slug_returns_404(self):
+        infographic = self.create_infographic(u'not-found', items=2)
+        response = self.client.get(reverse(
+            'infographics:item_infographic',
+            kwargs={'slug': infographic.slug, 'item_slug': 'missing'}))
+        self.assertEqual(response.status_code, 404)
+
+
+@patch('opps.infographics.cache.CACHE_ENABLED', True)
+class InfographicPageCacheTest(InfographicTestCase):
+
+    def setUp(self):
+        super(InfographicPageCacheTest, self).setUp()
+        cache.clear()
+        self.infographic = self.create_infographic(u'cached', items=2)
+        self.url = reverse('infographics:open_infographic',
+                           kwargs={'slug': self.infographic.slug})
+
+    def test_cached_page_runs_no_queries(self):
+        first = self.client.get(self.url)
+        with count_queries() as counter:
+            second = self.client.get(self.url)
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(counter.count, 0)
+
+    def test_save_invalidates_page(self):
+        self.client.get(self.url)
+        self.infographic.description = u'Changed description'
+        self.infographic.save()
+        self.assertContains(self.client.get(self.url), u'Changed description')
+
+    def test_item_save_invalidates_page(self):
+        item_url = reverse('infographics:item_infographic',
+                           kwargs={'slug': self.infographic.slug,
+                                   'item_slug': u'cached-item-0'})
+        self.client.get(item_url)
+        item = InfographicItem.objects.get(slug=u'cached-item-0')
+        item.description = u'Changed item'
+        item.save()
+        self.assertContains(self.client.get(item_url), u'Changed item')
+
+    def test_staff_preview_skips_cache(self):
+        self.infographic.published = False
+        self.infographic.save()
+        self.user.is_staff = True
+        self.user.set_password(u'infographics')
+        self.user.save()
+        self.client.login(username=u'infographics', password=u'infographics')
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        self.client.logout()
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    def lock_key(self):
+        return u'{0}:lock'.format(page_cache_key(
+            self.site.id, 'open_infographic', slug=self.infographic.slug))
+
+    def lock_page(self):
+        cache.set(self.lock_key(), 1)
+
+    def test_locked_page_serves_stale_copy(self):
+        first = self.client.get(self.url)
+        self.infographic.description = u'Changed description'
+        self.infographic.save()
+
+        # another worker is regenerating the page
+        self.lock_page()
+        with count_queries() as counter:
+            stale = self.client.get(self.url)
+        self.assertEqual(stale.content, first.content)
+        self.assertEqual(counter.count, 0)
+
+    @patch('opps.infographics.cache.LOCK_WAIT', 0.1)
+    def test_locked_page_without_copy_renders_after_wait(self):
+        self.lock_page()
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, self.infographic.title)
+
+    def test_expired_lock_is_kept_for_its_new_owner(self):
+        def expire_lock(*args, **kwargs):
+            # the lock expired and another worker took it
+            cache.set(self.lock_key(), u'other')
+            return get_snapshot(*args, **kwargs)
+
+        with patch('opps.infographics.views.get_snapshot',
+                   side_effect=expire_lock):
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+        self.assertEqual(cache.get(self.lock_key()), u'other')
+
+    def test_lock_is_released(self):
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        self.assertEqual(cache.get(self.lock_key()), None)
+
+    @patch('opps.infographics.cache.CACHE_TIMEOUT', 0)
+    @patch('opps.infographics.cache.STALE_TIMEOUT', 0)
+    def test_expired_page_is_regenerated(self):
+        self.client.get(self.url)
+        with count_queries() as counter:
+            self.client.get(self.url)
+        self.assertTrue(counter.count > 0)
+
+
+class ExportInfographicsTest(InfographicTestCase):
+
+    def setUp(self):
+        super(ExportInfographicsTest, self).setUp()
+        self.output_dir = tempfile.mkdtemp()
+        self.infographic = self.create_infographic(u'exported', items=2)
+
+    def tearDown(self):
+        shutil.rmtree(self.output_dir)
+
+    def export(self, **options):
+        call_command('export_infographics', self.output_dir, processes=1,
+                     **options)
+
+    def exported(self, url_name, **kwargs):
+        path = reverse('infographics:' + url_name, kwargs=kwargs)
+        return os.path.exists(os.path.join(
+            self.output_dir, path.strip('/'), 'index.html'))
+
+    def test_export_renders_infographic_and_items(self):
+        self.export()
+        self.assertTrue(self.exported('open_infographic', slug=u'exported'))
+        for item_slug in (u'exported-item-0', u'exported-item-1'):
+            self.assertTrue(self.exported('item_infographic',
+                                          slug=u'exported',
+                                          item_slug=item_slug))
+
+    def test_incremental_export_removes_unpublished(self):
+        self.export()
+        self.infographic.published = False
+        self.infographic.save()
+        self.export(incremental=True)
+        self.assertFalse(self.exported('open_infographic', slug=u'exported'))
+        self.assertFalse(self.exported('item_infographic', slug=u'exported',
+                                       item_slug=u'exported-item-0'))
+
+
+class TemplateResolutionTest(TestCase):
+
+    def setUp(self):
+        clear_template_cache()
+        self.calls = 0
+
+    def candidates(self):
+        self.calls += 1
+        return ['infographics/missing-slug.html',
+                'infographics/infographic_detail_gallery.html']
+
+    def test_resolved_template_is_memoized(self):
+        for i in range(3):
+            self.assertEqual(
+                resolve_template_name('key', self.candidates),
+                'infographics/infographic_detail_gallery.html')
+        self.assertEqual(self.calls, 1)
+
+    def test_missing_templates_resolve_to_none(self):
+        self.assertEqual(resolve_template_name(
+            'missing', lambda: ['infographics/missing-slug.html']), None)
+
+    def test_invalidate_resolves_again(self):
+        resolve_template_name('key', self.candidates)
+        invalidate_template_cache()
+        resolve_template_name('key', self.candidates)
+        self.assertEqual(self.calls, 2)
+
+
+class RequestResolverTest(InfographicTestCase):
+
+    def setUp(self):
+        super(RequestResolverTest, self).setUp()
+        clear_channel_cache()
+
+    def test_channel_is_resolved_once(self):
+        request = RequestFactory().get('/')
+        resolver = get_resolver(request)
+        self.assertTrue(get_resolver(request) is resolver)
+        resolver.channel(self.channel.long_slug)
+        with count_queries() as counter:
+            self.assertEqual(resolver.channel(self.channel.long_slug),
+                             self.channel)
+            self.assertEqual(get_resolver(RequestFactory().get('/')).channel(
+                self.channel.long_slug), self.channel)
+        self.assertEqual(counter.count, 0)
+
+    def test_missing_channel(self):
+        resolver = get_resolver(RequestFactory().get('/'))
+        self.assertEqual(resolver.channel(u'missing'), None)
+        with count_queries() as counter:
+            get_resolver(RequestFactory().get('/')).channel(u'missing')
+        self.assertEqual(counter.count, 1)
+
+    @patch('opps.infographics.resolvers.CHANNEL_CACHE_SIZE', 2)
+    def test_cache_size_is_bounded(self):
+        slugs = [u'channel-{0}'.format(i) for i in range(3)]
+        for slug in slugs:
+            Channel.objects.create(name=slug, slug=slug, published=True,
+                                   site=self.site, user=self.user)
+        for slug in slugs:
+            get_resolver(RequestFactory().get('/')).channel(slug)
+            self.assertTrue(len(resolvers._channels) <= 2)
+        # the cache started over for the third one
+        self.assertEqual(len(resolvers._channels), 1)
+
+    def test_channel_save_clears_cache(self):
+        resolver = get_resolver(RequestFactory().get('/'))
+        resolver.channel(self.channel.long_slug)
+        self.channel.save()
+        with count_queries() as counter:
+            get_resolver(RequestFactory().get('/')).channel(
+                self.channel.long_slug)
+        self.assertEqual(counter.count, 1)
+
+
+class KeysetPaginationTest(InfographicTestCase):
+
+    def setUp(self):
+        super(KeysetPaginationTest, self).setUp()
+        for i in range(7):
+            self.create_infographic(u'paginated-{0}'.format(i), order=i % 3)
+        self.queryset = Infographic.objects.all_published()
+        self.expected = list(self.queryset.order_by(*ORDERING))
+
+    def test_walk_forward_and_back(self):
+        pages = [paginate(self.queryset, per_page=3)]
+        while pages[-1].has_next:
+            pages.append(paginate(self.queryset, pages[-1].next_cursor,
+                                  per_page=3))
+        self.assertEqual([obj for page in pages for obj in page],
+                         self.expected)
+        self.assertEqual(len(pages), 3)
+
+        previous = paginate(self.queryset, pages[-1].prev_cursor, per_page=3)
+        self.assertEqual(previous.object_list, pages[-2].object_list)
+
+    def test_deep_page_runs_one_query(self):
+        page = paginate(self.queryset, per_page=3)
+        page = paginate(self.queryset, page.next_cursor, per_page=3)
+        with count_queries() as counter:
+            paginate(self.queryset, page.next_cursor, per_page=3)
+        self.assertEqual(counter.count, 1)
+
+    def test_invalid_cursor(self):
+        self.assertRaises(InvalidCursor, paginate, self.queryset, u'garbage')
+        response = self.client.get(reverse('infographics:list_infographic'),
+                                   {'cursor': u'garbage'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_json_list(self):
+        response = self.client.get(reverse('infographics:list_infographic'),
+                                   {'format': 'json'})
+        data = json.loads(response.content.decode('utf-8'))
+        self.assertEqual([i['id'] for i in data['results']],
+                         [i.pk for i in self.expected])
+        self.assertEqual(data['next'], None)
+
+
+class InfographicAPITest(InfographicTestCase):
+
+    def setUp(self):
+        super(InfographicAPITest, self).setUp()
+        self.infographic = self.create_infographic(u'api', items=3)
+        self.url = reverse('infographics:api_infographic',
+                           kwargs={'slug': self.infographic.slug})
+
+    def test_detail_with_items(self):
+        response = self.client.get(self.url)
+        data = json.loads(response.content.decode('utf-8'))
+        self.assertEqual(data['slug'], u'api')
+        self.assertEqual(len(data['items']), 3)
+        self.assertTrue(response.has_header('ETag'))
+        self.assertTrue(response.has_header('Last-Modified'))
+
+    def test_detail_conditional_get(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        item = InfographicItem.objects.get(slug=u'api-item-0')
+        item.title = u'Changed'
+        item.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_channel_change_changes_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        self.channel.slug = u'renamed'
+        self.channel.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(json.loads(response.content)['channel'],
+                         Channel.objects.get(pk=self.channel.pk).long_slug)
+
+    def test_unpublished_detail(self):
+        self.infographic.published = False
+        self.infographic.save()
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    def test_streamed_list(self):
+        self.create_infographic(u'api-other', items=1)
+        response = self.client.get(reverse('infographics:api_list_infographic'))
+        self.assertTrue(response.streaming)
+        data = json.loads(b''.join(response.streaming_content).decode('utf-8'))
+        self.assertEqual(sorted(i['slug'] for i in data['results']),
+                         [u'api', u'api-other'])
+
+        etag = response['ETag']
+        response = self.client.get(
+            reverse('infographics:api_list_infographic'),
+            HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+
+class SurrogateKeyTest(InfographicTestCase):
+
+    def setUp(self):
+        super(SurrogateKeyTest, self).setUp()
+        self.infographic = self.create_infographic(u'surrogate', items=2)
+        flush_purges()
+
+    def test_detail_surrogate_keys(self):
+        response = self.client.get(reverse(
+            'infographics:open_infographic',
+            kwargs={'slug': self.infographic.slug}))
+        keys = response[SURROGATE_KEY_HEADER].split()
+        self.assertTrue(infographic_key(self.infographic.pk) in keys)
+        self.assertTrue(image_key(self.image.pk) in keys)
+        self.assertTrue(channel_key(self.channel.pk) in keys)
+        for item in self.infographic.items.all():
+            self.assertTrue(item_key(item.pk) in keys)
+
+    def test_save_purges_in_batch(self):
+        with patch.object(LoggingPurgeBackend, 'purge') as purge:
+            with purge_batch():
+                self.infographic.save()
+                item = self.infographic.items.all()[0]
+                item.save()
+                self.assertFalse(purge.called)
+        self.assertEqual(purge.call_count, 1)
+        keys = purge.call_args[0][0]
+        self.assertTrue(infographic_key(self.infographic.pk) in keys)
+        self.assertTrue(item_key(item.pk) in keys)
+
+    def test_save_outside_request_purges(self):
+        with patch.object(LoggingPurgeBackend, 'purge') as purge:
+            self.infographic.save()
+        self.assertTrue(purge.called)
+        self.assertTrue(infographic_key(self.infographic.pk) in
+                        purge.call_args[0][0])
+
+    def test_scheduled_run_purges(self):
+        date_available = timezone.now() + timedelta(hours=1)
+        scheduled = self.create_infographic(u'scheduled-purge',
+                                            date_available=date_available)
+        with patch.object(LoggingPurgeBackend, 'purge') as purge:
+            update_live(date_available + timedelta(seconds=1))
+        self.assertEqual(purge.call_count, 1)
+        self.assertTrue(infographic_key(scheduled.pk) in
+                        purge.call_args[0][0])
+
+
+class AdminTestCase(InfographicTestCase):
+
+    def setUp(self):
+        super(AdminTestCase, self).setUp()
+        self.user.is_staff = True
+        self.user.is_superuser = True
+        self.user.set_password(u'infographics')
+        self.user.save()
+        self.client.login(username=u'infographics', password=u'infographics')
+
+
+class InfographicItemAdminTest(AdminTestCase):
+
+    def setUp(self):
+        super(InfographicItemAdminTest, self).setUp()
+        self.url = reverse('admin:infographics_infographicitem_changelist')
+
+    def get_query_count(self, data=None):
+        with count_queries() as counter:
+            response = self.client.get(self.url, data or {})
+        self.assertEqual(response.status_code, 200)
+        return counter.count
+
+    def test_changelist_query_count_does_not_grow(self):
+        self.create_infographic(u'admin-small', items=2)
+        small = self.get_query_count()
+        for i in range(5):
+            self.create_infographic(u'admin-large-{0}'.format(i), items=6)
+        self.assertEqual(self.get_query_count(), small)
+
+    def test_filter_by_infographic(self):
+        self.create_infographic(u'admin-a', items=2)
+        self.create_infographic(u'admin-b', items=3)
+        response = self.client.get(self.url, {'infographic': u'admin-b'})
+        self.assertEqual(response.context['cl'].result_count, 3)
+
+
+class InfographicAdminTest(AdminTestCase):
+
+    def get_query_count(self, infographic):
+        url = reverse('admin:infographics_infographic_change',
+                      args=[infographic.pk])
+        with count_queries() as counter:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return counter.count
+
+    def test_change_form_query_count_does_not_grow(self):
+        small = self.create_infographic(u'admin-small', items=2)
+        large = self.create_infographic(u'admin-large', items=30)
+        self.assertEqual(self.get_query_count(small),
+                         self.get_query_count(large))
+
+    def test_thumb_url_is_memoized(self):
+        with patch('opps.infographics.thumbnails.image_url') as image_url:
+            image_url.return_value = u'/thumb.jpg'
+            for i in range(3):
+                self.assertEqual(thumb_url(u'/memoized.jpg'), u'/thumb.jpg')
+        self.assertEqual(image_url.call_count, 1)
+
+
+class CSSBundleTest(InfographicTestCase):
+
+    def setUp(self):
+        super(CSSBundleTest, self).setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.storage = patch('opps.infographics.css.default_storage',
+                             FileSystemStorage(location=self.media_root,
+                                               base_url='/media/'))
+        self.storage.start()
+
+    def tearDown(self):
+        self.storage.stop()
+        shutil.rmtree(self.media_root)
+
+    def test_minify(self):
+        self.assertEqual(
+            minify(u'/* comment */\n a > b ,  c {\n color: red ;\n}\n d { }'),
+            u'a>b,c{color:red}')
+
+    def test_identical_css_is_shared(self):
+        first = self.create_infographic(u'css-first', items=1)
+        second = self.create_infographic(u'css-second', items=1)
+        first = Infographic.objects.get(pk=first.pk)
+        second = Infographic.objects.get(pk=second.pk)
+        self.assertTrue(first.css_hash)
+        self.assertEqual(first.css_hash, second.css_hash)
+        self.assertEqual(len(os.listdir(os.path.join(
+            self.media_root, 'infographics', 'css'))), 1)
+
+    def test_item_css_changes_bundle(self):
+        infographic = self.create_infographic(u'css-item', items=1)
+        css_hash = Infographic.objects.get(pk=infographic.pk).css_hash
+        item = infographic.items.all()[0]
+        item.css_text = u'#item { color: blue; }'
+        item.save()
+        infographic = Infographic.objects.get(pk=infographic.pk)
+        self.assertNotEqual(infographic.css_hash, css_hash)
+        with open(os.path.join(self.media_root, 'infographics', 'css',
+                               infographic.css_hash + '.css')) as f:
+            self.assertTrue(u'#item{color:blue}' in f.read())
+
+
+class InfographicFragmentCacheTest(InfographicTestCase):
+
+    template = template.Template(
+        u'{% load infographics_tags %}'
+        u'{% get_all_infographics 5 channel_slug %}')
+
+    def setUp(self):
+        super(InfographicFragmentCacheTest, self).setUp()
+        cache.clear()
+        self.infographic = self.create_infographic(u'fragment')
+
+    def render(self):
+        return self.template.render(template.Context({
+            'request': RequestFactory().get('/'),
+            'channel_slug': self.channel.slug}))
+
+    def test_fragment_is_cached(self):
+        first = self.render()
+        with count_queries() as counter:
+            self.assertEqual(self.render(), first)
+        self.assertEqual(counter.count, 0)
+
+    def test_edit_invalidates_fragment(self):
+        self.render()
+        self.infographic.title = u'Edited fragment'
+        self.infographic.save()
+        self.assertTrue(u'Edited fragment' in self.render())
+
+    def test_fragment_does_not_see_the_page(self):
+        fragment = template.Template(u'{{ request.path }}|{{ channel_slug }}')
+        with patch('opps.infographics.templatetags.infographics_tags.'
+                   'get_compiled_template', return_value=fragment):
+            self.assertEqual(self.render(), u'|' + self.channel.slug)
+
+
+class InfographicBoxLoaderTest(InfographicTestCase):
+
+    def setUp(self):
+        super(InfographicBoxLoaderTest, self).setUp()
+        cache.clear()
+        self.infographic = self.create_infographic(u'boxed')
+        self.middleware = InfographicBoxMiddleware()
+
+    def create_box(self, slug):
+        box = InfographicBox.objects.create(
+            name=slug, slug=slug, published=True, site=self.site,
+            user=self.user, channel=self.channel)
+        InfographicBoxInfographics.objects.create(
+            infographicbox=box, infographic=self.infographic)
+        return box
+
+    def render(self, slugs):
+        request = RequestFactory().get('/')
+        self.middleware.process_request(request)
+        t = template.Template(u'{% load infographics_tags %}' + u''.join(
+            u'{{% get_infographicbox "{0}" %}}'.format(slug)
+            for slug in slugs))
+        response = HttpResponse(t.render(template.Context(
+            {'request': request})))
+        return self.middleware.process_response(request, response).content
+
+    def get_query_count(self, slugs):
+        cache.clear()
+        with count_queries() as counter:
+            self.render(slugs)
+        return counter.count
+
+    def test_boxes_load_in_one_batch(self):
+        slugs = [u'box-{0}'.format(i) for i in range(12)]
+        for slug in slugs:
+            self.create_box(slug)
+        self.assertEqual(self.get_query_count(slugs[:1]),
+                         self.get_query_count(slugs))
+        content = self.render(slugs)
+        self.assertEqual(content.count(b'infographicbox-box-'), 12)
+        self.assertFalse(b'<!--infographicbox:' in content)
+
+    def test_rendered_box_is_cached(self):
+        self.create_box(u'cached-box')
+        first = self.render([u'cached-box'])
+        with count_queries() as counter:
+            self.assertEqual(self.render([u'cached-box']), first)
+        self.assertEqual(counter.count, 0)
+
+    def test_infographic_edit_invalidates_box(self):
+        self.create_box(u'edited-box')
+        self.render([u'edited-box'])
+        self.infographic.title = u'Edited box'
+        self.infographic.save()
+        self.assertTrue(b'Edited box' in self.render([u'edited-box']))
+
+    def test_forged_placeholder_is_not_rendered(self):
+        self.create_box(u'forged-box')
+        request = RequestFactory().get('/')
+        self.middleware.process_request(request)
+        forged = u'<!--infographicbox:forged-box||0123456789abcdef-->'
+        response = self.middleware.process_response(
+            request, HttpResponse(forged))
+        self.assertEqual(response.content, forged.encode('utf-8'))
+
+
+class ScheduledPublicationTest(InfographicTestCase):
+
+    def setUp(self):
+        super(ScheduledPublicationTest, self).setUp()
+        self.date_available = timezone.now() + timedelta(hours=1)
+        self.infographic = self.create_infographic(
+            u'scheduled', date_available=self.date_available)
+        self.url = reverse('infographics:open_infographic',
+                           kwargs={'slug': u'scheduled'})
+
+    def test_scheduled_infographic_is_not_live(self):
+        self.assertFalse(Infographic.objects.get(pk=self.infographic.pk).is_live)
+        self.assertFalse(Infographic.objects.all_published().filter(
+            pk=self.infographic.pk).exists())
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+        self.assertEqual(next_change(), self.date_available)
+
+    def test_goes_live_when_date_available_arrives(self):
+        self.client.get(self.url)
+        self.assertEqual(update_live(), (0, 0))
+        self.assertEqual(
+            update_live(self.date_available + timedelta(seconds=1)), (1, 0))
+        infographic = Infographic.objects.get(pk=self.infographic.pk)
+        self.assertTrue(infographic.is_live)
+        self.assertTrue(infographic.date_update > self.infographic.date_update)
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+
+    def test_bulk_unpublished_goes_offline(self):
+        live = self.create_infographic(u'live')
+        Infographic.objects.filter(pk=live.pk).update(published=False)
+        self.assertEqual(update_live(), (0, 1))
+        self.assertFalse(Infographic.objects.get(pk=live.pk).is_live)
+
+    def test_queryset_keeps_publishable_api(self):
+        live = self.create_infographic(u'live')
+        self.assertEqual(list(Infographic.objects.filter(
+            channel=self.channel).all_published()), [live])
+        self.assertTrue('published' in
+                        Infographic.objects.get_all_published_lookups())
+
+    def test_objects_is_default_manager(self):
+        other = Site.objects.create(domain=u'other.example.com',
+                                    name=u'Other')
+        infographic = Infographic.objects.create(
+            title=u'Other', slug=u'other', published=True, site=other,
+            user=self.user, channel=self.channel)
+        self.assertTrue(Infographic._default_manager is Infographic.objects)
+        self.assertTrue(Infographic._default_manager.filter(
+            pk=infographic.pk).exists())
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite',
+                     'query plans are checked on SQLite')
+class QueryPlanTest(InfographicTestCase):
+    """
+    The public queries must search an index matching their filters, a
+    change in the queries or the indexes that brings back a full scan
+    fails here.
+    """
+
+    def setUp(self):
+        super(QueryPlanTest, self).setUp()
+        self.infographic = self.create_infographic(u'planned', items=2)
+
+    def get_plan(self, queryset):
+        sql, params = queryset.query.get_compiler(
+            using=queryset.db).as_sql()
+        cursor = connection.cursor()
+        cursor.execute(u'EXPLAIN QUERY PLAN ' + sql, params)
+        return [row[-1] for row in cursor.fetchall()]
+
+    def get_indexes(self, table):
+        cursor = connection.cursor()
+        cursor.execute(u'PRAGMA index_list({0})'.format(table))
+        indexes = {}
+        for row in cursor.fetchall():
+            cursor.execute(u'PRAGMA index_info({0})'.format(row[1]))
+            indexes[row[1]] = tuple(info[2] for info in cursor.fetchall())
+        return indexes
+
+    def assertSortsWithIndex(self, queryset):
+        for line in self.get_plan(queryset):
+            self.assertFalse(u'TEMP B-TREE' in line,
+                             u'{0} sorts without an index'.format(line))
+
+    def assertUsesIndex(self, queryset, table, columns):
+        """
+        The plan must read table through an index whose leading columns
+        are columns
+        """
+        indexes = self.get_indexes(table)
+        expected = [name for name, index_columns in indexes.items()
+                    if index_columns[:len(columns)] == columns]
+        self.assertTrue(expected, u'no index on {0}{1}'.format(table,
+                                                              columns))
+        plan = [line for line in self.get_plan(queryset)
+                if re.search(r'\b{0}\b'.format(table), line)]
+        self.assertTrue(plan, u'{0} is not in the query plan'.format(table))
+        for line in plan:
+            used = re.search(r'USING (?:COVERING )?INDEX (\S+)', line)
+            self.assertTrue(used and used.group(1) in expected,
+                            u'{0} does not use {1}'.format(line, expected))
+
+    def test_list_query(self):
+        queryset = Infographic.objects.all_published().filter(
+            site=self.site).order_by(*ORDERING)[:20]
+        self.assertUsesIndex(queryset, u'infographics_infographic',
+                             (u'site_id', u'is_live'))
+        self.assertSortsWithIndex(queryset)
+
+    def test_channel_list_query(self):
+        queryset = Infographic.objects.all_published().filter(
+            channel=self.channel).order_by(*ORDERING)[:20]
+        self.assertUsesIndex(queryset, u'infographics_infographic',
+                             (u'channel_id', u'is_live'))
+        self.assertSortsWithIndex(queryset)
+
+    def test_detail_query(self):
+        queryset = Infographic.objects.filter(
+            site=self.site, slug=u'planned', is_live=True)
+        self.assertUsesIndex(queryset, u'infographics_infographic',
+                             (u'site_id', u'slug'))
+
+    def test_items_query(self):
+        # the items prefetch of the detail page
+        queryset = InfographicItem.objects.filter(
+            infographicitem_item__infographic__in=[self.infographic.pk])
+        self.assertUsesIndex(queryset,
+                             u'infographics_infographicinfographicitem',
+                             (u'infographic_id',))
+
+
+class InfographicMenuTest(InfographicTestCase):
+
+    def setUp(self):
+        super(InfographicMenuTest, self).setUp()
+        self.infographic = self.create_infographic(u'menu')
+        for order, slug, group in ((3, u'last', None),
+                                   (1, u'first', u'Group'),
+                                   (0, u'intro', None),
+                                   (2, u'second', u'Group')):
+            item = InfographicItem.objects.create(
+                title=slug, slug=slug, group=group)
+            InfographicInfographicItem.objects.create(
+                infographic=self.infographic, item=item, order=order)
+
+    def get_menu(self):
+        return Infographic.objects.get(pk=self.infographic.pk).menu
+
+    def test_menu_is_grouped_and_ordered(self):
+        self.assertEqual(self.get_menu(), [
+            {'group': None, 'items': [{'title': u'intro', 'slug': u'intro'}]},
+            {'group': u'Group', 'items': [
+                {'title': u'first', 'slug': u'first'},
+                {'title': u'second', 'slug': u'second'}]},
+            {'group': None, 'items': [{'title': u'last', 'slug': u'last'}]},
+        ])
+
+    def test_menu_follows_membership_changes(self):
+        InfographicInfographicItem.objects.get(item__slug=u'last').delete()
+        item = InfographicItem.objects.get(slug=u'intro')
+        item.title = u'Introduction'
+        item.save()
+        menu = self.get_menu()
+        self.assertEqual(menu[0]['items'][0]['title'], u'Introduction')
+        self.assertEqual(len(menu), 2)
+
+    def test_detail_renders_menu_in_order(self):
+        response = self.client.get(reverse(
+            'infographics:open_infographic', kwargs={'slug': u'menu'}))
+        content = response.content.decode('utf-8')
+        positions = [content.index(reverse(
+            'infographics:item_infographic',
+            kwargs={'slug': u'menu', 'item_slug': slug}))
+            for slug in (u'intro', u'first', u'second', u'last')]
+        self.assertEqual(positions, sorted(positions))
+
+    def test_membership_is_unique(self):
+        with self.assertRaises(IntegrityError):
+            InfographicInfographicItem.objects.create(
+                infographic=self.infographic,
+                item=InfographicItem.objects.get(slug=u'intro'))
+
+
+class InfographicSnapshotTest(InfographicTestCase):
+
+    def setUp(self):
+        super(InfographicSnapshotTest, self).setUp()
+        self.infographic = self.create_infographic(u'snapshot', items=3)
+
+    def get(self, name, **kwargs):
+        kwargs['slug'] = u'snapshot'
+        with count_queries() as counter:
+            response = self.client.get(reverse(
+                'infographics:{0}'.format(name), kwargs=kwargs))
+        return response, counter.count
+
+    def test_published_pages_are_one_read(self):
+        response, queries = self.get('open_infographic')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(queries, 1)
+
+        response, queries = self.get('item_infographic',
+                                     item_slug=u'snapshot-item-1')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(b'Item 1' in response.content)
+        self.assertEqual(queries, 1)
+
+        response, queries = self.get('api_infographic')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [item['slug'] for item in json.loads(
+                response.content.decode('utf-8'))['items']],
+            [u'snapshot-item-0', u'snapshot-item-1', u'snapshot-item-2'])
+        self.assertEqual(queries, 1)
+
+    def test_item_change_rebuilds_snapshot(self):
+        item = InfographicItem.objects.get(slug=u'snapshot-item-0')
+        item.title = u'Rebuilt'
+        item.save()
+        document = InfographicSnapshot.objects.get(
+            infographic=self.infographic).document
+        self.assertEqual(document['infographic']['items'][0]['title'],
+                         u'Rebuilt')
+        self.assertEqual(document['infographic']['menu'][0]['items'][0],
+                         {'title': u'Rebuilt', 'slug': u'snapshot-item-0'})
+
+    def test_request_rebuilds_once(self):
+        items = list(InfographicItem.objects.filter(
+            infographicitem_item__infographic=self.infographic))
+        with patch('opps.infographics.signals._rebuild',
+                   side_effect=signals._rebuild) as rebuild:
+            signals._request_started()
+            for item in items:
+                item.title = u'Edited'
+                item.save()
+            self.assertEqual(rebuild.call_count, 0)
+            signals._request_finished()
+        self.assertEqual(rebuild.call_count, 1)
+        document = InfographicSnapshot.objects.get(
+            infographic=self.infographic).document
+        self.assertEqual(set(item['title']
+                             for item in document['infographic']['items']),
+                         set([u'Edited']))
+
+    def test_unpublished_infographic_loses_snapshot(self):
+        self.infographic.published = False
+        self.infographic.save()
+        self.assertFalse(InfographicSnapshot.objects.filter(
+            infographic=self.infographic).exists())
+        response, queries = self.get('open_infographic')
+        self.assertEqual(response.status_code, 404)
+
+    def test_staff_preview_reads_models(self):
+        self.infographic.published = False
+        self.infographic.save()
+        self.user.is_staff = True
+        self.user.set_password(u'infographics')
+        self.user.save()
+        self.client.login(username=u'infographics', password=u'infographics')
+        response, queries = self.get('open_infographic')
+        self.assertEqual(response.status_code, 200)
+
+    def test_delete_infographic(self):
+        self.infographic.delete()
+        self.assertFalse(InfographicSnapshot.objects.exists())
+
+    def test_channel_is_read_with_snapshot(self):
+        snapshot = InfographicSnapshot.objects.get(
+            infographic=self.infographic)
+        self.channel.name = u'Renamed'
+        self.channel.save()
+        self.assertEqual(InfographicSnapshot.objects.get(
+            pk=snapshot.pk).date_update, snapshot.date_update)
+        document = get_snapshot(self.site, u'snapshot')
+        self.assertEqual(document['infographic']['channel']['name'],
+                         u'Renamed')
+
+        self.channel.delete()
+        document = get_snapshot(self.site, u'snapshot')
+        self.assertEqual(document['infographic']['channel'], None)
+        self.assertEqual(document['api']['channel'], None)
+
+
+class AlbumPaginationTest(InfographicTestCase):
+
+    def setUp(self):
+        super(AlbumPaginationTest, self).setUp()
+        self.album = Album.objects.create(
+            title=u'Album', slug=u'album', published=True, site=self.site,
+            user=self.user, channel=self.channel)
+        self.album_size = ALBUM_PAGE_SIZE * 2 + 3
+        for i in range(self.album_size):
+            image = Image.objects.create(
+                title=u'Photo {0}'.format(i), slug=u'photo-{0}'.format(i),
+                image=u'infographics/photo-{0}.jpg'.format(i),
+                published=True, site=self.site, user=self.user)
+            ContainerImage.objects.create(container=self.album, image=image,
+                                          order=i)
+        self.infographic = self.create_infographic(u'album-gallery')
+        item = InfographicItem.objects.create(
+            title=u'Album item', slug=u'album-item', album=self.album)
+        InfographicInfographicItem.objects.create(
+            infographic=self.infographic, item=item)
+
+    def test_gallery_renders_first_page(self):
+        response = self.client.get(reverse(
+            'infographics:item_infographic',
+            kwargs={'slug': u'album-gallery', 'item_slug': u'album-item'}))
+        content = response.content.decode('utf-8')
+        self.assertEqual(content.count(u'photo-'), ALBUM_PAGE_SIZE)
+        self.assertTrue(u'infographic-album-more' in content)
+
+    def test_album_pages(self):
+        url = reverse('infographics:api_item_album',
+                      kwargs={'slug': u'album-gallery',
+                              'item_slug': u'album-item'})
+        titles = []
+        while url:
+            with count_queries() as counter:
+                data = json.loads(self.client.get(url).content.decode(
+                    'utf-8'))
+            self.assertEqual(counter.count, 2)
+            titles.extend(image['title'] for image in data['results'])
+            url = data['next']
+        self.assertEqual(titles, [u'Photo {0}'.format(i)
+                                  for i in range(self.album_size)])
+
+    def test_images_without_file_keep_the_offset(self):
+        Image.objects.filter(slug=u'photo-0').update(image=u'')
+        InfographicItem.objects.get(slug=u'album-item').save()
+        response = self.client.get(reverse(
+            'infographics:item_infographic',
+            kwargs={'slug': u'album-gallery', 'item_slug': u'album-item'}))
+        content = response.content.decode('utf-8')
+        self.assertEqual(content.count(u'photo-'), ALBUM_PAGE_SIZE - 1)
+        self.assertTrue(u'?offset={0}"'.format(ALBUM_PAGE_SIZE) in content)
+
+    def album_titles(self):
+        document = InfographicSnapshot.objects.get(
+            infographic=self.infographic).document
+        album = document['infographic']['items'][0]['album']
+        return [image['title'] for image in album['images']]
+
+    def test_album_change_rebuilds_snapshot(self):
+        self.assertEqual(self.album_titles()[0], u'Photo 0')
+        ContainerImage.objects.filter(order=0).get().delete()
+        self.assertEqual(self.album_titles()[0], u'Photo 1')
+
+        image = Image.objects.get(slug=u'photo-1')
+        image.title = u'Renamed'
+        image.save()
+        self.assertEqual(self.album_titles()[0], u'Renamed')
+
+    def test_unknown_item(self):
+        response = self.client.get(reverse(
+            'infographics:api_item_album',
+            kwargs={'slug': u'album-gallery', 'item_slug': u'missing'}))
+        self.assertEqual(response.status_code, 404)
+
+
+class RecordingWarmer(NullWarmer):
+
+    def __init__(self):
+        self.urls = []
+
+    def warm(self, url):
+        self.urls.append(url)
+        return True
+
+
+class RenditionTest(InfographicTestCase):
+
+    def setUp(self):
+        super(RenditionTest, self).setUp()
+        self.warmer = RecordingWarmer()
+        self.patcher = patch('opps.infographics.warmup.get_warmer',
+                             return_value=self.warmer)
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+        super(RenditionTest, self).tearDown()
+
+    def test_map_has_template_sizes(self):
+        infographic = Infographic.objects.get(
+            pk=self.create_infographic(u'renditions', items=2).pk)
+        entry = infographic.renditions[self.image.image.url]
+        self.assertEqual(set(entry),
+                         set([size_key(960), size_key(600), size_key(60, 60)]))
+
+    def test_page_uses_map(self):
+        self.create_infographic(u'renditions')
+        infographic = Infographic.objects.get(slug=u'renditions')
+        response = self.client.get(reverse(
+            'infographics:open_infographic', kwargs={'slug': u'renditions'}))
+        entry = infographic.renditions[self.image.image.url]
+        content = response.content.decode('utf-8')
+        self.assertTrue(entry[size_key(960)] in content)
+        self.assertTrue(entry[size_key(600)] in content)
+
+    def test_going_live_warms_renditions(self):
+        date_available = timezone.now() + timedelta(hours=1)
+        infographic = self.create_infographic(
+            u'scheduled', date_available=date_available)
+        self.assertEqual(self.warmer.urls, [])
+        update_live(date_available + timedelta(seconds=1))
+        self.assertEqual(sorted(self.warmer.urls), sorted(
+            Infographic.objects.get(pk=infographic.pk).renditions[
+                self.image.image.url].values()))
+
+    def test_admin_warms_renditions_before_going_live(self):
+        model_admin = InfographicAdmin(Infographic, admin_site)
+        request = RequestFactory().post('/')
+        request.user = self.user
+        infographic = Infographic(
+            title=u'published', slug=u'published', type='gallery',
+            published=True, site=self.site, user=self.user,
+            channel=self.channel, top_image=self.image, main_image=self.image)
+        model_admin.save_model(request, infographic, None, False)
+        self.assertFalse(Infographic.objects.get(pk=infographic.pk).is_live)
+        self.assertEqual(self.warmer.urls, [])
+
+        model_admin.save_related(request, Mock(instance=infographic), [],
+                                 False)
+        live = Infographic.objects.get(pk=infographic.pk)
+        self.assertTrue(live.is_live)
+        self.assertEqual(sorted(self.warmer.urls), sorted(
+            live.renditions[self.image.image.url].values()))
+
+        self.warmer.urls = []
+        model_admin.save_model(request, live, None, True)
+        model_admin.save_related(request, Mock(instance=live), [], True)
+        self.assertTrue(Infographic.objects.get(pk=live.pk).is_live)
+        self.assertEqual(self.warmer.urls, [])
+
+    def test_warm_command_rebuilds_snapshots(self):
+        infographic = self.create_infographic(u'renditions')
+        Infographic.objects.filter(pk=infographic.pk).update(renditions=None)
+        InfographicSnapshot.objects.filter(infographic=infographic).update(
+            document={})
+        call_command('warm_infographic_renditions', stdout=StringIO())
+        document = InfographicSnapshot.objects.get(
+            infographic=infographic).document
+        self.assertEqual(document['infographic']['renditions'],
+                         Infographic.objects.get(
+                             pk=infographic.pk).renditions)
+
+
+class TimelineSnapshotTest(InfographicTestCase):
+
+    def setUp(self):
+        super(TimelineSnapshotTest, self).setUp()
+        cache.clear()
+        self.timeline = Timeline.objects.create(
+            headline=u'History', start_date=date(2013, 1, 1))
+        self.url = reverse('infographics:api_timeline',
+                           kwargs={'pk': self.timeline.pk})
+
+    def test_timeline_is_serialized_on_save(self):
+        snapshot = TimelineSnapshot.objects.get(timeline=self.timeline)
+        data = json.loads(snapshot.data)
+        self.assertEqual(data['timeline']['headline'], u'History')
+        self.assertEqual(data['timeline']['startDate'], u'2013,1,1')
+
+    def test_endpoint_is_validated_by_etag(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['timeline']['headline'],
+                         u'History')
+        response = self.client.get(self.url,
+                                   HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_edit_changes_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        self.timeline.headline = u'New history'
+        self.timeline.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_json_is_served_as_written(self):
+        self.timeline.json = {'timeline': {'headline': u'Written',
+                                           'type': u'default', 'date': []}}
+        self.timeline.save()
+        response = self.client.get(self.url)
+        self.assertEqual(json.loads(response.content),
+                         {'timeline': {'headline': u'Written',
+                                       'type': u'default', 'date': []}})
+
+    def test_source_is_read_as_it_is(self):
+        source = u'https://docs.google.com/spreadsheet/pub?key=history'
+        self.timeline.source = source
+        self.timeline.save()
+        self.assertFalse(TimelineSnapshot.objects.filter(
+            timeline=self.timeline).exists())
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response['Location'], source)
+
+        self.create_infographic(u'history', type='timeline',
+                                timeline=self.timeline)
+        response = self.client.get(reverse(
+            'infographics:open_infographic', kwargs={'slug': u'history'}))
+        content = response.content.decode('utf-8')
+        self.assertTrue(escapejs(source) in content)
+        self.assertFalse(self.url in content)
+
+    def test_container_edit_changes_etag(self):
+        album = Album.objects.create(
+            title=u'Event', slug=u'event', published=True, site=self.site,
+            user=self.user, channel=self.channel,
+            date_available=timezone.now())
+        TimelineContainer.objects.create(timeline=self.timeline,
+                                         container=album)
+        response = self.client.get(self.url)
+        self.assertEqual(
+            [event['headline'] for event in json.loads(
+                response.content)['timeline']['date']], [u'Event'])
+        etag = response['ETag']
+        album.title = u'Renamed event'
+        album.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [event['headline'] for event in json.loads(
+                response.content)['timeline']['date']], [u'Renamed event'])
+
+        etag = response['ETag']
+        album.delete()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['timeline']['date'], [])
+
+    def test_serialized_without_snapshot(self):
+        TimelineSnapshot.objects.all().delete()
+        cache.clear()
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        self.assertTrue(TimelineSnapshot.objects.filter(
+            timeline=self.timeline).exists())
+
+    def test_unknown_timeline(self):
+        response = self.client.get(reverse('infographics:api_timeline',
+                                           kwargs={'pk': 0}))
+        self.assertEqual(response.status_code, 404)
+
+    def test_page_embeds_endpoint(self):
+        self.create_infographic(u'history', type='timeline',
+                                timeline=self.timeline)
+        response = self.client.get(reverse(
+            'infographics:open_infographic', kwargs={'slug': u'history'}))
+        self.assertTrue(self.url in response.content.decode('utf-8'))
+
+
+class SearchIndexingTest(InfographicTestCase):
+
+    def setUp(self):
+        super(SearchIndexingTest, self).setUp()
+        self.index = InfographicIndex()
+        self.old = self.create_infographic(u'old')
+        self.since = timezone.now() + timedelta(seconds=1)
+        Infographic.objects.filter(pk=self.old.pk).update(
+            date_update=self.since - timedelta(days=1))
+
+    def test_full_run(self):
+        recent = self.create_infographic(u'recent')
+        pks, stale = changed(self.index)
+        self.assertEqual(sorted(pks), sorted([self.old.pk, recent.pk]))
+        self.assertEqual(stale, [])
+        self.assertEqual(update_index(self.index, pks, chunk_size=1), 2)
+
+    def test_since(self):
+        recent = self.create_infographic(u'recent')
+        offline = self.create_infographic(u'offline')
+        Infographic.objects.filter(pk__in=[recent.pk, offline.pk]).update(
+            date_update=self.since)
+        Infographic.objects.filter(pk=offline.pk).update(is_live=False)
+        self.assertEqual(changed(self.index, self.since),
+                         ([recent.pk], [offline.pk]))
+
+    def test_document_is_compact(self):
+        infographic = self.create_infographic(
+            u'compact', tags=u'Eleição, mapa',
+            description=u'<p>O <strong>mapa</strong> da eleição</p>')
+        prepared = self.index.full_prepare(infographic)
+        self.assertFalse(u'<' in prepared['text'])
+        self.assertEqual(prepared['text'].split().count(u'mapa'), 1)
+        self.assertTrue(u'eleicao' in prepared['text'].split())
+        self.assertEqual(prepared['tags'], [u'Eleição', u'mapa'])
+        self.assertEqual(prepared['channel'], self.channel.long_slug)
+        self.assertEqual(prepared['type'], u'gallery')
+        self.assertEqual(prepared['site'], self.site.pk)
+
+    def test_document_words(self):
+        self.assertEqual(document(u'Ação ação', None, u'<b>b</b> B'),
+                         u'Ação Acao b')
+
+    def test_benchmark(self):
+        out = StringIO()
+        call_command('benchmark_infographics_index', count=3, processes=1,
+                     stdout=out)
+        self.assertTrue(u'3 docs' in out.getvalue())
+
+
+class ItemSearchIndexTest(InfographicTestCase):
+
+    def setUp(self):
+        super(ItemSearchIndexTest, self).setUp()
+        self.index = InfographicItemIndex()
+        self.infographic = self.create_infographic(u'items', items=2)
+        self.membership = InfographicInfographicItem.objects.filter(
+            infographic=self.infographic).order_by('item__order')[0]
+
+    def test_document_links_to_item(self):
+        prepared = self.index.full_prepare(self.membership)
+        self.assertEqual(prepared['url'], reverse(
+            'infographics:item_infographic',
+            kwargs={'slug': u'items', 'item_slug': u'items-item-0'}))
+        self.assertEqual(prepared['infographic'], u'items')
+        self.assertEqual(prepared['site'], self.site.pk)
+        self.assertTrue(u'Item' in prepared['text'].split())
+
+    def test_parent_publication_state(self):
+        self.assertEqual(self.index.index_queryset().filter(
+            infographic=self.infographic).count(), 2)
+        since = timezone.now()
+        self.infographic.published = False
+        self.infographic.save()
+        self.assertFalse(self.index.index_queryset().filter(
+            infographic=self.infographic).exists())
+        pks, stale = changed(self.index, since)
+        self.assertEqual(pks, [])
+        self.assertEqual(len(stale), 2)
+
+    def test_deleted_membership_is_removed(self):
+        pk = self.membership.pk
+        with patch('haystack.backends.simple_backend.SimpleSearchBackend.'
+                   'remove') as remove:
+            self.membership.delete()
+        remove.assert_called_once_with(
+            u'infographics.infographicinfographicitem.{0}'.format(pk))
+        pks, stale = changed(self.index, timezone.now() - timedelta(days=1))
+        self.assertFalse(pk in pks + stale)
+
+    def test_item_change_is_incremental(self):
+        since = timezone.now()
+        item = self.membership.item
+        item.description = u'New description'
+        item.save()
+        pks, stale = changed(self.index, since)
+        self.assertEqual(len(pks), 2)
+        self.assertEqual(stale, [])
+
+
+class SearchQueueTest(InfographicTestCase):
+
+    def setUp(self):
+        super(SearchQueueTest, self).setUp()
+        from haystack import connections, connection_router
+        self.processor = QueuedSignalProcessor(connections, connection_router)
+
+    def tearDown(self):
+        self.processor.teardown()
+        super(SearchQueueTest, self).tearDown()
+
+    def queued(self, model):
+        return sorted(SearchQueueEntry.objects.filter(
+            model=model).values_list('object_id', flat=True))
+
+    def test_saves_are_coalesced(self):
+        infographic = self.create_infographic(u'queued', items=2)
+        infographic.title = u'Queued'
+        infographic.save()
+        infographic.save()
+        self.assertEqual(self.queued(u'infographics.infographic'),
+                         [infographic.pk])
+        self.assertEqual(
+            self.queued(u'infographics.infographicinfographicitem'),
+            sorted(InfographicInfographicItem.objects.filter(
+                infographic=infographic).values_list('pk', flat=True)))
+
+    def test_flush_in_batches(self):
+        infographic = self.create_infographic(u'queued', items=2)
+        self.assertEqual(flush(batch_size=1), (1, 0))
+        self.assertEqual(SearchQueueEntry.objects.count(), 2)
+        self.assertEqual(flush(), (2, 0))
+        self.assertEqual(flush(), (0, 0))
+
+        infographic.published = False
+        infographic.save()
+        self.assertEqual(flush(), (0, 3))
+
+    def test_deleted_objects_are_removed(self):
+        infographic = self.create_infographic(u'queued', items=1)
+        flush()
+        infographic.delete()
+        self.assertEqual(flush(), (0, 2))
+
+    def test_deleted_membership_is_queued(self):
+        infographic = self.create_infographic(u'queued', items=2)
+        flush()
+        with patch('haystack.backends.simple_backend.SimpleSearchBackend.'
+                   'remove') as remove:
+            InfographicInfographicItem.objects.filter(
+                infographic=infographic)[0].delete()
+            self.assertFalse(remove.called)
+            self.assertEqual(flush(), (0, 1))
+        self.assertTrue(remove.called)
+
+    def test_other_models_are_indexed(self):
+        with patch('haystack.signals.BaseSignalProcessor.handle_save') as (
+                handle_save):
+            album = Album.objects.create(
+                title=u'Album', slug=u'album', published=True,
+                site=self.site, user=self.user, channel=self.channel)
+            self.create_infographic(u'queued')
+        senders = [call[0][0] for call in handle_save.call_args_list]
+        self.assertTrue(Album in senders)
+        self.assertFalse(Infographic in senders)
+
+        with patch('haystack.signals.BaseSignalProcessor.handle_delete') as (
+                handle_delete):
+            album.delete()
+        self.assertTrue(Album in [call[0][0]
+                                  for call in handle_delete.call_args_list])
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+import threading
+
+from django.conf import settings
+from django.utils.translation import ugettext_lazy as _
+
+from opps.images.generate import image_url
+
+from .renditions import size_key
+
+
+# rendition urls kept per process, the memo starts over when it is full
+THUMB_CACHE_SIZE = getattr(settings, 'OPPS_INFOGRAPHICS_THUMB_CACHE_SIZE',
+                           10000)
+
+_lock = threading.Lock()
+_urls = {}
+
+
+def thumb_url(path, width=60, height=60):
+    """
+    image_url(path, width, height), memoized by path and size. The url only
+    depends on them, so it is computed once per process.
+    """
+    key = (path, width, height)
+    try:
+        return _urls[key]
+    except KeyError:
+        pass
+
+    url = image_url(path, width=width, height=height)
+    with _lock:
+        if len(_urls) >= THUMB_CACHE_SIZE:
+            _urls.clear()
+        _urls[key] = url
+    return url
+
+
+def thumb_tag(image, width=60, height=60, renditions=None):
+    """
+    renditions is the precomputed map of an infographic, when the image
+    has one
+    """
+    if not image:
+        return _(u'No Image')
+    url = image.image.url
+    try:
+        src = renditions[url][size_key(width, height)]
+    except (KeyError, TypeError):
+        src = thumb_url(url, width, height)
+    return u'<img width="{0}px" height="{1}px" src="{2}" />'.format(
+        width, height, src)
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+import json
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+
+from opps.timelinejs.models import Timeline, TimelineContainer
+
+from .cache import timeline_cache_key
+from .models import TimelineSnapshot
+
+
+TIMELINE_CACHE_TIMEOUT = getattr(
+    settings, 'OPPS_INFOGRAPHICS_TIMELINE_CACHE_TIMEOUT', 60 * 60 * 24)
+
+
+def _date(value):
+    # TimelineJS reads dates as "year,month,day"
+    if value:
+        return u'{0},{1},{2}'.format(value.year, value.month, value.day)
+    return u''
+
+
+def _asset(media, credit=u'', caption=u''):
+    return {'media': media or u'', 'credit': credit or u'',
+            'caption': caption or u''}
+
+
+def _event(container):
+    media = u''
+    if container.main_image and container.main_image.image:
+        media = container.main_image.image.url
+    return {'startDate': _date(container.date_available),
+            'headline': container.title,
+            'text': container.hat or u'',
+            'asset': _asset(media, caption=container.main_image_caption)}
+
+
+def serialize_timeline(timeline):
+    """
+    TimelineJS data of timeline, its published containers being the events.
+    A timeline whose json is filled in is shown exactly as written, one
+    with a source is read from it by TimelineJS and is not serialized.
+    """
+    if timeline.json:
+        return timeline.json
+    memberships = TimelineContainer.objects.filter(
+        timeline=timeline, container__published=True
+    ).select_related('container__main_image').order_by(
+        'container__date_available', 'pk')
+    return {'timeline': {
+        'headline': timeline.headline,
+        'type': timeline.type,
+        'text': timeline.text,
+        'startDate': _date(timeline.start_date),
+        'asset': _asset(timeline.asset_media, timeline.asset_credit,
+                        timeline.asset_caption),
+        'date': [_event(membership.container)
+                 for membership in memberships],
+    }}
+
+
+def update_timeline_snapshots(timeline_ids):
+    """
+    Serialize the timelines again and return {pk: (etag, data)}, the ones
+    gone or read from their source are dropped
+    """
+    timeline_ids = set(pk for pk in timeline_ids if pk)
+    built = {}
+    for timeline in Timeline.objects.filter(pk__in=timeline_ids).exclude(
+            source__gt=u''):
+        data = json.dumps(serialize_timeline(timeline),
+                          cls=DjangoJSONEncoder)
+        etag = md5(data.encode('utf-8')).hexdigest()
+        if not TimelineSnapshot.objects.filter(timeline=timeline).update(
+                data=data, etag=etag):
+            TimelineSnapshot.objects.create(timeline=timeline, data=data,
+                                            etag=etag)
+        built[timeline.pk] = (etag, data)
+        cache.set(timeline_cache_key(timeline.pk), built[timeline.pk],
+                  TIMELINE_CACHE_TIMEOUT)
+    gone = timeline_ids - set(built)
+    if gone:
+        TimelineSnapshot.objects.filter(timeline__in=gone).delete()
+    for pk in gone:
+        cache.delete(timeline_cache_key(pk))
+    return built
+
+
+def get_timeline(timeline_id):
+    """
+    (etag, data) of a serialized timeline, from the cache, then from its
+    snapshot, built on the first request when missing. None for a timeline
+    that does not exist.
+    """
+    key = timeline_cache_key(timeline_id)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+    snapshots = list(TimelineSnapshot.objects.filter(
+        timeline=timeline_id).values_list('etag', 'data')[:1])
+    if not snapshots:
+        return update_timeline_snapshots([timeline_id]).get(timeline_id)
+    cache.set(key, snapshots[0], TIMELINE_CACHE_TIMEOUT)
+    return snapshots[0]
@@ -4,6 +4,8 @@
 from django.conf.urls import patterns, url
 
 from .views import InfographicDetail, InfographicList, ChannelInfographicList
+from .api import (infographic_list, infographic_detail, album_images,
+                  timeline_data)
 
 
 urlpatterns = patterns(
@@ -13,6 +15,26 @@ urlpatterns = patterns(
         InfographicList.as_view(),
         name='list_infographic',
     ),
+    url(
+        r'^api/$',
+        infographic_list,
+        name='api_list_infographic',
+    ),
+    url(
+        r'^api/(?P<slug>[\w-]+)\.json$',
+        infographic_detail,
+        name='api_infographic',
+    ),
+    url(
+        r'^api/(?P<slug>[\w-]+)/(?P<item_slug>[\w-]+)/album\.json$',
+        album_images,
+        name='api_item_album',
+    ),
+    url(
+        r'^api/timelines/(?P<pk>\d+)\.json$',
+        timeline_data,
+        name='api_timeline',
+    ),
     url(
         r'^channel/(?P<channel__long_slug>[\w//-]+)$',
         ChannelInfographicList.as_view(),
@@ -1,24 +1,75 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-from django.conf import settings
-from django.contrib.sites.models import get_current_site
+import json
+
 from django.views.generic.detail import DetailView
 from django.views.generic.list import ListView
 from django.shortcuts import get_object_or_404
-from django.utils import timezone
+from django.http import Http404, HttpResponse
 
-from opps.channels.models import Channel
 from .models import Infographic
+from .cache import CachedPageMixin
+from .loading import resolve_template_name
+from .resolvers import get_resolver
+from .snapshot import get_snapshot, wrap
+from .pagination import paginate, InvalidCursor, PAGINATE_BY
+from .surrogate import (SurrogateKeyMixin, infographic_keys, infographic_key,
+                        image_key, channel_key, site_key, list_key)
+
+
+class KeysetListMixin(SurrogateKeyMixin):
+    """
+    Cursor pagination for the infographic lists, ?cursor=<token> walks the
+    pages and ?format=json returns the page as JSON
+    """
 
-# IS THERE A BETTER WAY?
-if not 'endless_pagination' in settings.INSTALLED_APPS:
-    settings.INSTALLED_APPS += (
-        'endless_pagination',
-    )
+    per_page = PAGINATE_BY
+
+    def get_page(self, request, queryset):
+        try:
+            self.page = paginate(queryset.select_related('main_image'),
+                                 request.GET.get('cursor'), self.per_page)
+        except InvalidCursor:
+            raise Http404
+        return self.page
+
+    def get_surrogate_keys(self):
+        keys = [list_key(self.site.id), site_key(self.site.id)]
+        for infographic in self.page:
+            keys.append(infographic_key(infographic.pk))
+            if infographic.main_image_id:
+                keys.append(image_key(infographic.main_image_id))
+        return keys
+
+    def serialize(self, infographic):
+        return {
+            'id': infographic.pk,
+            'title': infographic.title,
+            'slug': infographic.slug,
+            'headline': infographic.headline,
+            'type': infographic.type,
+            'date_available': infographic.date_available.isoformat(),
+            'url': infographic.get_absolute_url(),
+        }
+
+    def render_page(self, request, page, context):
+        if request.GET.get('format') == 'json':
+            return HttpResponse(json.dumps({
+                'results': [self.serialize(i) for i in page.object_list],
+                'next': page.next_cursor,
+                'previous': page.prev_cursor,
+            }), content_type='application/json')
+
+        context.update({
+            'page_obj': page,
+            'next_cursor': page.next_cursor,
+            'prev_cursor': page.prev_cursor,
+        })
+        return self.render_to_response(context)
 
 
-class InfographicList(ListView):
+class InfographicList(CachedPageMixin, KeysetListMixin, ListView):
 
     context_object_name = "infographics"
 
@@ -33,26 +84,32 @@ class InfographicList(ListView):
 
     @property
     def queryset(self):
-        self.site = get_current_site(self.request)
+        self.site = get_resolver(self.request).site
         return Infographic.objects.all_published()
 
     def get(self, request, *args, **kwargs):
         self.object_list = self.get_queryset()
-        context = self.get_context_data(object_list=self.object_list)
-        context['channel'] = Channel.objects.get_homepage(site=self.site)
+        page = self.get_page(request, self.object_list)
+        context = self.get_context_data(object_list=page.object_list)
+        context['channel'] = get_resolver(request).homepage
 
-        return self.render_to_response(context)
+        return self.render_page(request, page, context)
 
 
-class ChannelInfographicList(ListView):
+class ChannelInfographicList(CachedPageMixin, KeysetListMixin, ListView):
 
     context_object_name = "infographics"
 
     @property
     def template_name(self):
-        homepage = Channel.objects.get_homepage(site=self.site)
+        key = ('channel_list', self.site.id,
+               self.kwargs.get('channel__long_slug'))
+        return resolve_template_name(key, self.get_template_candidates)
+
+    def get_template_candidates(self):
+        homepage = get_resolver(self.request).homepage
         if not homepage:
-            return None
+            return []
 
         long_slug = self.kwargs.get('channel__long_slug',
                                     homepage.long_slug)
@@ -63,45 +120,67 @@ class ChannelInfographicList(ListView):
         if self.site.id > 1:
             domain_folder = "{0}/infographics".format(self.site)
 
-        return '{0}/{1}.html'.format(domain_folder, long_slug)
+        return ['{0}/{1}.html'.format(domain_folder, long_slug)]
+
+    def get_surrogate_keys(self):
+        keys = super(ChannelInfographicList, self).get_surrogate_keys()
+        long_slug = self.kwargs['channel__long_slug'][:-1]
+        channel = get_resolver(self.request).channel(long_slug)
+        if channel:
+            keys.append(channel_key(channel.pk))
+        return keys
 
     @property
     def queryset(self):
-        self.site = get_current_site(self.request)
+        resolver = get_resolver(self.request)
+        self.site = resolver.site
         long_slug = self.kwargs['channel__long_slug'][:-1]
-        get_object_or_404(Channel, long_slug=long_slug)
-        return Infographic.objects.filter(
-            channel__long_slug=long_slug,
-            published=True,
-            date_available__lte=timezone.now()
-        )
+        channel = resolver.channel(long_slug)
+        if channel is None:
+            raise Http404
+        # by channel_id, the (channel, is_live, order, ...) index then
+        # serves the ordering too
+        return Infographic.objects.all_published().filter(channel=channel)
 
     def get(self, request, *args, **kwargs):
         self.object_list = self.get_queryset()
-        context = self.get_context_data(object_list=self.object_list)
+        page = self.get_page(request, self.object_list)
+        context = self.get_context_data(object_list=page.object_list)
 
-        try:
-            long_slug = self.kwargs['channel__long_slug'][:-1]
-            context['channel'] = Channel.objects.get(long_slug=long_slug)
-        except:
-            context['channel'] = Channel.objects.get_homepage(site=self.site)
+        resolver = get_resolver(request)
+        long_slug = self.kwargs['channel__long_slug'][:-1]
+        context['channel'] = (resolver.channel(long_slug) or
+                              resolver.homepage)
 
-        return self.render_to_response(context)
+        return self.render_page(request, page, context)
 
 
-class InfographicDetail(DetailView):
+class InfographicDetail(CachedPageMixin, SurrogateKeyMixin, DetailView):
 
     context_object_name = "infographic"
     model = Infographic
+    snapshot = None
 
     def get_template_names(self):
         """
         Return a list of template names to be used for the request. Must return
         a list. May not be called if get_template is overridden.
+
+        The template found for each (site, channel, slug, type) is memoized,
+        see opps.infographics.loading
         """
+        key = ('detail', self.site.id,
+               self.object.channel and self.object.channel.long_slug,
+               self.kwargs['slug'], self.object.type)
+        name = resolve_template_name(key, self.get_template_candidates)
+        if name:
+            return [name]
+        return self.get_template_candidates()
+
+    def get_template_candidates(self):
         names = []
 
-        self.template_name_suffix = "{0}_{1}".format(
+        template_name_suffix = "{0}_{1}".format(
             self.template_name_suffix,
             self.object.type
         )
@@ -129,7 +208,7 @@ class InfographicDetail(DetailView):
             # 2. try a generic channel template
             # opps_infographic/channel-slug/<model>_detail.html
             names.append('{0}/{1}/{2}{3}.html'.format(
-                app_label, long_slug, object_name, self.template_name_suffix
+                app_label, long_slug, object_name, template_name_suffix
             ))
 
         # 3. try infographic template (all channels)
@@ -144,25 +223,62 @@ class InfographicDetail(DetailView):
             names.append("%s/%s%s.html" % (
                 self.object._meta.app_label,
                 self.object._meta.object_name.lower(),
-                self.template_name_suffix
+                template_name_suffix
             ))
         elif hasattr(self, 'model') and hasattr(self.model, '_meta'):
             names.append("%s/%s%s.html" % (
                 self.model._meta.app_label,
                 self.model._meta.object_name.lower(),
-                self.template_name_suffix
+                template_name_suffix
             ))
 
         return names
 
+    def get_surrogate_keys(self):
+        if self.snapshot is not None:
+            return self.snapshot['keys']
+        return infographic_keys(self.object)
+
+    def get_queryset(self):
+        """
+        Everything the detail templates touch is loaded here, so rendering
+        costs a fixed number of queries no matter how many items exist.
+        """
+        return Infographic.objects.select_related(
+            'channel', 'top_image', 'main_image', 'timeline'
+        ).prefetch_related(
+            'items__image', 'items__album', 'items__timeline'
+        )
+
+    def is_preview(self, request):
+        return request.user and request.user.is_staff
+
+    def bypass_page_cache(self, request):
+        # staff sees unpublished content, never cache it
+        return self.is_preview(request)
+
     def get_object(self):
-        self.site = get_current_site(self.request)
+        """
+        The published page is rendered from the infographic snapshot,
+        only staff previews read the models
+        """
+        self.site = get_resolver(self.request).site
         filters = dict(slug=self.kwargs['slug'], site=self.site)
-        preview_enabled = self.request.user and self.request.user.is_staff
+        preview_enabled = self.is_preview(self.request)
         if not preview_enabled:
-            filters['date_available__lte'] = timezone.now()
-            filters['published'] = True
-        return get_object_or_404(Infographic, **filters)
+            self.snapshot = get_snapshot(self.site, self.kwargs['slug'])
+            if self.snapshot is not None:
+                return wrap(self.snapshot['infographic'])
+            # not built yet, see build_infographic_snapshots
+            filters['is_live'] = True
+        return get_object_or_404(self.get_queryset(), **filters)
+
+    def get_item(self, item_slug):
+        # items are already prefetched, avoid one more query
+        for item in self.object.items.all():
+            if item.slug == item_slug:
+                return item
+        raise Http404
 
     def get(self, request, *args, **kwargs):
         self.object = self.get_object()
@@ -170,11 +286,7 @@ class InfographicDetail(DetailView):
 
         # get item by slug
         if 'item_slug' in kwargs:
-            item_slug = kwargs['item_slug']
-            context['item'] = get_object_or_404(
-                self.object.items,
-                slug=item_slug
-            )
+            context['item'] = self.get_item(kwargs['item_slug'])
 
         if self.object.channel:
             context['channel'] = self.object.channel
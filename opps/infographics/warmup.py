@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+import logging
+import urllib2
+from multiprocessing.pool import ThreadPool
+
+from django.conf import settings
+from django.utils.importlib import import_module
+
+
+RENDITION_WARMER = getattr(settings, 'OPPS_INFOGRAPHICS_RENDITION_WARMER',
+                           'opps.infographics.warmup.HTTPWarmer')
+WARMUP_THREADS = getattr(settings, 'OPPS_INFOGRAPHICS_WARMUP_THREADS', 8)
+WARMUP_TIMEOUT = getattr(settings, 'OPPS_INFOGRAPHICS_WARMUP_TIMEOUT', 30)
+
+logger = logging.getLogger(__name__)
+
+
+class HTTPWarmer(object):
+    """
+    Request each rendition from the image server, which generates and
+    caches it on the first request
+    """
+
+    def warm(self, url):
+        """
+        Make the image backend generate the rendition at url, return whether
+        it succeeded
+        """
+        if not url.startswith(('http://', 'https://')):
+            return False
+        try:
+            urllib2.urlopen(url, timeout=WARMUP_TIMEOUT).read()
+        except (urllib2.URLError, IOError) as e:
+            logger.warning(u'Rendition warm-up failed for %s: %s', url, e)
+            return False
+        return True
+
+
+class NullWarmer(HTTPWarmer):
+
+    def warm(self, url):
+        return True
+
+
+_warmer = {}
+
+
+def get_warmer():
+    if RENDITION_WARMER not in _warmer:
+        module, name = RENDITION_WARMER.rsplit('.', 1)
+        _warmer[RENDITION_WARMER] = getattr(import_module(module), name)()
+    return _warmer[RENDITION_WARMER]
+
+
+def warm_renditions(urls, threads=WARMUP_THREADS):
+    """
+    Request every url with a pool of threads, rendition generation is
+    network bound. Return the urls that failed.
+    """
+    urls = list(urls)
+    if not urls:
+        return []
+    warmer = get_warmer()
+    pool = ThreadPool(min(threads, len(urls)))
+    try:
+        results = pool.map(warmer.warm, urls)
+    finally:
+        pool.close()
+        pool.join()
+    return [url for url, warmed in zip(urls, results) if not warmed]
+